@@ -3,10 +3,14 @@
 #----------------------------------------------------------------------------#
 
 import json
-from datetime import datetime
+from collections import namedtuple
+from functools import lru_cache
+from datetime import datetime, timezone
+from itertools import groupby
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, session, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
@@ -14,6 +18,11 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
+from search import SearchIndex
+from cache import TTLCache, PageCache
+from importer import FormValidator, read_rows, run_import
+from query_stats import QueryStats
+from engine_profile import EngineProfile, get_pool_stats
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,13 +30,38 @@ from flask_migrate import Migrate
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+engine_profile = EngineProfile.from_config(app.config)
+engine_profile.init_app(app)
 db = SQLAlchemy(app)
+engine_profile.configure(db.engine)
 migrate = Migrate(app,db)
+query_stats = QueryStats(app, db)
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# Genres are shared rows linked to venues and artists through
+# these tables. The (genre_id, ...) indexes are the inverted index
+# used to list everything with a given genre.
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -37,12 +71,13 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
     image_link = db.Column(db.String(500))
     website = db.Column(db.String)
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
+    search_text = db.Column(db.Text)
     shows = db.relationship('Show', backref='venue')
 
 class Artist(db.Model):
@@ -53,33 +88,109 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
     website = db.Column(db.String)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
+    search_text = db.Column(db.Text)
     shows = db.relationship('Show', backref='artist', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_Artist_sort_name_id', db.func.lower(name), id),
+    )
+
 class Show(db.Model):
     __tablename__ = 'Shows'
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    start_time = db.Column(db.String)
+    start_time = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.Index('ix_Shows_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+# Format the show form posts start_time in.
+SHOW_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SHOWS_PER_PAGE = 30
+ARTISTS_PER_PAGE = 50
+JUMP_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+venue_search = SearchIndex(db, Venue, ['name', 'city', 'state', 'genres'])
+artist_search = SearchIndex(db, Artist, ['name', 'city', 'state', 'genres'])
+
+#----------------------------------------------------------------------------#
+# View models.
+#----------------------------------------------------------------------------#
+
+# Read only rows the detail pages are rendered from, so the pages
+# never hold on to or change mapped instances and can be cached.
+SHOW_LIST_FIELDS = ['upcoming_shows', 'past_shows', 'upcoming_shows_count', 'past_shows_count']
+
+VENUE_DETAIL_COLUMNS = ['id', 'name', 'city', 'state', 'address', 'phone', 'website',
+  'facebook_link', 'seeking_talent', 'seeking_description', 'image_link']
+VenueDetail = namedtuple('VenueDetail', VENUE_DETAIL_COLUMNS + ['genres'] + SHOW_LIST_FIELDS)
+
+ARTIST_DETAIL_COLUMNS = ['id', 'name', 'city', 'state', 'phone', 'website',
+  'facebook_link', 'seeking_venue', 'seeking_description', 'image_link']
+ArtistDetail = namedtuple('ArtistDetail', ARTIST_DETAIL_COLUMNS + ['genres'] + SHOW_LIST_FIELDS)
+
+# Built details keyed by ('venue', id) or ('artist', id).
+detail_cache = TTLCache(app.config.get('DETAIL_CACHE_SIZE', 1024), app.config.get('DETAIL_CACHE_TTL', 300))
+
+# Rendered list pages keyed by their arguments and by the versions
+# of the tables they show. The handlers that write a table bump it.
+page_cache = PageCache(app.config.get('PAGE_CACHE_SIZE', 256), app.config.get('PAGE_CACHE_TTL', 300))
+VENUE_LIST_TABLES = (Venue.__tablename__, Show.__tablename__, Genre.__tablename__)
+ARTIST_LIST_TABLES = (Artist.__tablename__, Genre.__tablename__)
+SHOW_LIST_TABLES = (Show.__tablename__, Artist.__tablename__, Venue.__tablename__)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+# babel's own named formats, which aren't patterns.
+BABEL_DATETIME_FORMATS = ('short', 'long')
+
+def format_datetime(value, format='medium', locale=None):
+  offset = value.utcoffset() if isinstance(value, datetime) else None
+  return format_datetime_cached(value, offset, format,
+    locale or app.config.get('DATETIME_LOCALE') or babel.dates.LC_TIME)
+
+"""
+  The text of recently rendered timestamps. Show times repeat
+  across the pages, and each page renders many of them.
+  Aware datetimes for the same instant are equal whatever their
+  zone, so the offset of value is part of the key, or the wall
+  time of whichever was cached first would be rendered.
+"""
+@lru_cache(maxsize=app.config.get('DATETIME_CACHE_SIZE', 4096))
+def format_datetime_cached(value, offset, format, locale):
+  date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+  if format in BABEL_DATETIME_FORMATS:
+    return babel.dates.format_datetime(date, format, locale=locale)
+  if date.tzinfo is None:
+    date = date.replace(tzinfo=timezone.utc)
+  pattern, locale = get_datetime_pattern(format, locale)
+  return pattern.apply(date, locale)
+
+"""
+  returns the babel pattern for format and the babel Locale,
+  compiled once for each format and locale.
+"""
+@lru_cache(maxsize=64)
+def get_datetime_pattern(format, locale):
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -87,6 +198,16 @@ app.jinja_env.filters['datetime'] = format_datetime
 # Controllers.
 #----------------------------------------------------------------------------#
 
+"""
+  Returns the page render builds from tables, served from 
+  page_cache unless flashed messages are waiting to be shown 
+  on it, as the layout renders them.
+"""
+def render_cached(key, tables, render):
+  if '_flashes' in session:
+    return render()
+  return page_cache.get_or_render(key, tables, render)
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -97,43 +218,71 @@ def index():
 
 @app.route('/venues')
 def venues():
+  genre = request.args.get('genre')
+  return render_cached(('venues', genre), VENUE_LIST_TABLES,
+    lambda: render_template('pages/venues.html', areas=get_venue_areas(genre), genre=genre))
+
+"""
+  Loads every venue together with its upcoming show count 
+  in a single query ordered by area, then groups the rows 
+  into the city/state areas in one pass.
+  Only venues with the genre are listed if one is passed.
+"""
+def get_venue_areas(genre=None):
+  now = datetime.now(timezone.utc)
+  query = db.session.query(
+      Venue.id, Venue.name, Venue.city, Venue.state,
+      db.func.count(Show.id).label('num_upcoming_shows')
+    )
+  if genre:
+    query = query.filter(Venue.id.in_(get_ids_with_genre(venue_genres.c.venue_id, genre)))
+  rows = query.outerjoin(Show, db.and_(Show.venue_id == Venue.id, Show.start_time > now)
+    ).group_by(Venue.id
+    ).order_by(Venue.state, Venue.city, Venue.name
+    ).all()
+
   data = []
-  areas = Venue.query.distinct('city','state').all()
-  for area in areas:
-    venues = Venue.query.filter(Venue.city==area.city, Venue.state == area.state).all()
-    record = {
-      'city': area.city,
-      'state': area.state,
-      'venues': venues
-    }
-    data.append(record)
-  return render_template('pages/venues.html', areas=data)
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    data.append({
+      'city': city,
+      'state': state,
+      'venues': [{
+        'id': venue.id,
+        'name': venue.name,
+        'num_upcoming_shows': venue.num_upcoming_shows
+      } for venue in venues]
+    })
+  return data
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   search_term = request.form.get('search_term', '')
-  look_for = '%{0}%'.format(search_term)
-  items = Venue.query.filter(Venue.name.ilike(look_for)).all()
-  response={
-    'count': len(items),
-    'data': items
-  }
+  page = request.form.get('page', 1, type=int)
+  response = venue_search.search(search_term, page)
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-  data = Venue.query.get(venue_id)
-  data.genres = data.genres.split(",")
-  data = sep_shows(data, get_show_artist_ob)
+  data = detail_cache.get_or_set(('venue', venue_id), lambda: get_venue_detail(venue_id))
+  if data is None:
+    abort(404)
   return render_template('pages/show_venue.html', venue=data)
 
-def get_show_artist_ob(show):
-  return {
-        'start_time': show.start_time,
-        'artist_image_link': show.artist.image_link,
-        'artist_name': show.artist.name,
-        'artist_id': show.artist_id
-      }
+def get_venue_detail(venue_id):
+  return get_detail(VenueDetail, Venue, VENUE_DETAIL_COLUMNS, venue_genres.c.venue_id,
+    venue_id, Show.venue_id, get_show_artist_query())
+
+"""
+  query for the shows of a venue, with the artist 
+  columns the venue page shows.
+"""
+def get_show_artist_query():
+  return db.session.query(
+      Show.start_time,
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    ).join(Artist, Artist.id == Show.artist_id)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -147,8 +296,11 @@ def create_venue_form():
 def create_venue_submission():
   try:
     # on successful db insert, flash success
-    db.session.add(create_venue_from_form(request.form))
+    new_venue = create_venue_from_form(request.form)
+    db.session.add(new_venue)
     db.session.commit()
+    invalidate_details(venue_ids=[new_venue.id])
+    page_cache.bump(Venue.__tablename__, Genre.__tablename__)
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   except:
     # on unsuccessful db insert, flash an error instead.
@@ -161,15 +313,16 @@ def create_venue_submission():
 """
   Creates and returns a venue object based on the 
   information in the passed form. 
+  known_genres is passed through to get_genres.
 """
-def create_venue_from_form(form):
+def create_venue_from_form(form, known_genres=None):
   new_venue = Venue()
   new_venue.name = form['name']
   new_venue.city = form['city']
   new_venue.state = form['state']
   new_venue.address = form['address']
   new_venue.phone = form['phone']
-  new_venue.genres = form.getlist('genres')
+  new_venue.genres = get_genres(form.getlist('genres'), known_genres)
   new_venue.facebook_link = form['facebook_link']
   new_venue.image_link = form['image_link']
   new_venue.website = form['website']
@@ -179,8 +332,11 @@ def create_venue_from_form(form):
 def delete_venue(venue_id):
   try:
     venue = Venue.query.get(venue_id)
+    artist_ids = [show.artist_id for show in venue.shows]
     db.session.delete(venue)
     db.session.commit()
+    invalidate_details(venue_ids=[int(venue_id)], artist_ids=artist_ids)
+    page_cache.bump(Venue.__tablename__, Show.__tablename__)
   except:
     db.session.rollback()
   finally:
@@ -195,59 +351,166 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  return render_template('pages/artists.html', artists=Artist.query.all())
+  genre = request.args.get('genre')
+  after = decode_artist_cursor(request.args.get('after'))
+  letter = request.args.get('letter', '').upper()
+  if letter not in JUMP_LETTERS or len(letter) != 1:
+    letter = None
+  jump_index = None
+  if app.config.get('ARTIST_JUMP_INDEX'):
+    # the same for every page, so it is counted once per genre.
+    jump_index = page_cache.get_or_render(('artist_jump_index', genre), ARTIST_LIST_TABLES,
+      lambda: get_artist_jump_index(genre))
+  return render_cached(('artists', genre, after, letter), ARTIST_LIST_TABLES,
+    lambda: render_template('pages/artists.html', genre=genre, jump_index=jump_index,
+      **get_artist_page(genre, after, letter)))
+
+def get_artist_query(genre=None, *columns):
+  query = db.session.query(Artist.id, Artist.name, *columns)
+  if genre:
+    query = query.filter(Artist.id.in_(get_ids_with_genre(artist_genres.c.artist_id, genre)))
+  return query
+
+"""
+  Returns one page of artists ordered by (lower(name), id) with 
+  the cursor for the next page, or None on the last page. Only 
+  the id and name columns the list shows are loaded. Like the 
+  show feed it pages on the key rather than an offset, and 
+  letter starts the list at the first name from that letter on.
+"""
+def get_artist_page(genre=None, after=None, letter=None, per_page=ARTISTS_PER_PAGE):
+  sort_name = db.func.lower(Artist.name)
+  query = get_artist_query(genre, sort_name.label('sort_name'))
+  if after is not None:
+    # (sort_name, id) > after, spelled out so SQLite can seek the
+    # index to it as well as Postgres does.
+    after_name, after_id = after
+    query = query.filter(sort_name >= after_name,
+      db.or_(sort_name > after_name, Artist.id > after_id))
+  elif letter is not None:
+    query = query.filter(sort_name >= letter.lower())
+  # one extra row tells us whether there is a next page.
+  artists = query.order_by(sort_name, Artist.id).limit(per_page + 1).all()
+
+  next_cursor = None
+  if len(artists) > per_page:
+    artists = artists[:per_page]
+    next_cursor = encode_artist_cursor(artists[-1])
+  return {'artists': artists, 'next_cursor': next_cursor}
+
+"""
+  Counts the artists, with the genre if one is passed, by the 
+  first letter of their name in one GROUP BY. Returns 
+  [(letter, count)] from A to Z, after '#' for the names that 
+  start with anything else.
+"""
+def get_artist_jump_index(genre=None):
+  initial = db.func.upper(db.func.substr(Artist.name, 1, 1))
+  counts = dict(get_artist_query(genre).with_entities(initial, db.func.count(Artist.id)
+    ).group_by(initial).all())
+  jump_index = [(letter, counts.pop(letter, 0)) for letter in JUMP_LETTERS]
+  return [('#', sum(counts.values()))] + jump_index
+
+def encode_artist_cursor(artist):
+  return '{0}|{1}'.format(artist.sort_name, artist.id)
+
+"""
+  Turns the cursor passed in the query string back into the
+  (lower(name), id) key. Returns None if there isn't a valid one.
+"""
+def decode_artist_cursor(cursor):
+  if not cursor:
+    return None
+  name, _, artist_id = cursor.rpartition('|')
+  if not artist_id.isdigit():
+    return None
+  return name, int(artist_id)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   search_term = request.form.get('search_term', '')
-  look_for = '%{0}%'.format(search_term)
-  items = Artist.query.filter(Artist.name.ilike(look_for)).all()
-  response={
-    'count': len(items),
-    'data': items
-  }
+  page = request.form.get('page', 1, type=int)
+  response = artist_search.search(search_term, page)
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  data = get_form_object_for_artists(Artist.query.get(artist_id))
+  data = detail_cache.get_or_set(('artist', artist_id), lambda: get_artist_detail(artist_id))
+  if data is None:
+    abort(404)
   return render_template('pages/show_artist.html', artist=data)
 
-def get_form_object_for_artists(data):
-  data.genres = data.genres.split(",")
-  data = sep_shows(data, get_show_venue_ob)
-  return data
+def get_artist_detail(artist_id):
+  return get_detail(ArtistDetail, Artist, ARTIST_DETAIL_COLUMNS, artist_genres.c.artist_id,
+    artist_id, Show.artist_id, get_show_venue_query())
 
-  """
-    seperate shows into past and future.
-    Also adds the counts for past and future.
-    You must pass the function which returns the 
-    object to append to the upcoming shows.
-  """
-def sep_shows(data, get_ob_function):
-  now = datetime.now()
-  data.upcoming_shows = []
-  data.past_shows = []
-  
-  for show in data.shows:
-    if(datetime.strptime(show.start_time,"%Y-%m-%d %H:%M:%S") > now):
-      data.upcoming_shows.append(get_ob_function(show))
-    else:
-      data.past_shows.append(get_ob_function(show))
-  data.upcoming_shows_count = len(data.upcoming_shows)
-  data.past_shows_count = len(data.past_shows)
-  return data
+"""
+  Builds the read only detail of a venue or artist, or returns 
+  None if there is no row with that id. 
+  One query loads the columns of the row along with its genre 
+  names, one more loads its shows in start_time order through 
+  the (venue_id, start_time) or (artist_id, start_time) index. 
+  owner_column is the Show column that points at the row, 
+  and shows_query selects the columns to list for each show.
+"""
+def get_detail(detail_class, model, columns, genre_column, entity_id, owner_column, shows_query):
+  rows = db.session.query(*[getattr(model, column) for column in columns]
+    ).add_columns(Genre.name.label('genre')
+    ).outerjoin(genre_column.table, genre_column == model.id
+    ).outerjoin(Genre, Genre.id == genre_column.table.c.genre_id
+    ).filter(model.id == entity_id
+    ).order_by(Genre.name
+    ).all()
+  if not rows:
+    return None
+
+  fields = dict(zip(columns, rows[0]))
+  fields['genres'] = [row.genre for row in rows if row.genre is not None]
+  fields.update(sep_shows(owner_column, entity_id, shows_query))
+  return detail_class(**fields)
 
 """
-  populates an object with shows data. 
+  seperate shows into past and future.
+  Also adds the counts for past and future.
+  The database marks which shows are upcoming, so nothing is 
+  parsed or compared here. Past shows are listed latest first.
 """
-def get_show_venue_ob(show):
+def sep_shows(owner_column, entity_id, shows_query):
+  now = datetime.now(timezone.utc)
+  shows = shows_query.add_columns((Show.start_time > now).label('upcoming')
+    ).filter(owner_column == entity_id
+    ).order_by(Show.start_time
+    ).all()
+  upcoming_shows = [show for show in shows if show.upcoming]
+  past_shows = [show for show in reversed(shows) if not show.upcoming]
   return {
-        'start_time': show.start_time,
-        'venue_image_link': show.venue.image_link,
-        'venue_name': show.venue.name,
-        'venue_id': show.venue_id
-      }
+    'upcoming_shows': upcoming_shows,
+    'past_shows': past_shows,
+    'upcoming_shows_count': len(upcoming_shows),
+    'past_shows_count': len(past_shows)
+  }
+
+"""
+  drops the cached details of the venues and artists passed 
+  so they are rebuilt on the next view.
+"""
+def invalidate_details(venue_ids=(), artist_ids=()):
+  for venue_id in venue_ids:
+    detail_cache.delete(('venue', venue_id))
+  for artist_id in artist_ids:
+    detail_cache.delete(('artist', artist_id))
+
+"""
+  query for the shows of an artist, with the venue 
+  columns the artist page shows.
+"""
+def get_show_venue_query():
+  return db.session.query(
+      Show.start_time,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Venue.image_link.label('venue_image_link')
+    ).join(Venue, Venue.id == Show.venue_id)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -290,8 +553,11 @@ def create_artist_form():
 def create_artist_submission():
   try:
     # on successful db insert, flash success
-    db.session.add(create_artist_from_form(request.form))
+    new_artist = create_artist_from_form(request.form)
+    db.session.add(new_artist)
     db.session.commit()
+    invalidate_details(artist_ids=[new_artist.id])
+    page_cache.bump(Artist.__tablename__, Genre.__tablename__)
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
   except:
     # on unsuccessful db insert, flash an error instead.
@@ -304,38 +570,112 @@ def create_artist_submission():
 """
   Creates and returns the artist object 
   using the values in the passed form
+  known_genres is passed through to get_genres.
 """
-def create_artist_from_form(form):
+def create_artist_from_form(form, known_genres=None):
   new_artist = Artist()
   new_artist.name = form['name']
   new_artist.city = form['city']
   new_artist.state = form['state']
   new_artist.phone = form['phone']
-  new_artist.genres = form['genres']
+  new_artist.genres = get_genres(form.getlist('genres'), known_genres)
   new_artist.facebook_link = form['facebook_link']
   new_artist.image_link = form['image_link']
   new_artist.website = form['website']
   return new_artist
 
+#  Genres
+#  ----------------------------------------------------------------
+
+"""
+  Returns the Genre rows for the names passed, 
+  creating the ones that don't exist yet.
+  known_genres is an optional {name: Genre} dict to look 
+  genres up in instead of the database, new genres are 
+  added to it. Bulk imports share one across all rows.
+"""
+def get_genres(names, known_genres=None):
+  names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+  if not names:
+    return []
+  if known_genres is None:
+    known_genres = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names)).all()}
+  for name in names:
+    if name not in known_genres:
+      known_genres[name] = Genre(name=name)
+  return [known_genres[name] for name in names]
+
+"""
+  subquery for the ids in id_column linked to the genre.
+  It is answered from the genre name and (genre_id, ...) indexes
+  without reading the venues or artists themselves.
+"""
+def get_ids_with_genre(id_column, genre):
+  return db.session.query(id_column
+    ).join(Genre, Genre.id == id_column.table.c.genre_id
+    ).filter(Genre.name == genre)
+
 #  Shows
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
 def shows():
-  data = []
-  shows=Show.query.all()
-  for show in shows:
-    data.append({
-      'artist_image_link': show.artist.image_link,
-      'start_time': show.start_time,
-      'artist_name': show.artist.name,
-      'venue_name': show.venue.name,
-      'venue_id': show.venue_id,
-      'artist_id': show.artist_id
-    })
-  
-  # data = Show.query.join(Venue, Show.venue_id == Venue.id).join(Artist, Artist.id == Show.artist_id).all()
-  return render_template('pages/shows.html', shows=data) 
+  after = decode_show_cursor(request.args.get('after'))
+  return render_cached(('shows', after), SHOW_LIST_TABLES,
+    lambda: render_template('pages/shows.html', **get_show_page(after)))
+
+def get_show_page(after):
+  data, next_cursor = get_show_feed(after)
+  return {'shows': data, 'next_cursor': next_cursor}
+
+"""
+  Returns one page of shows ordered by (start_time, id) along with
+  the cursor for the next page, or None on the last page. 
+  The shows are loaded with their artist and venue in one joined 
+  query that only selects the columns the shows page needs.
+  Paging is done on the (start_time, id) key rather than with an 
+  offset so every page costs the same no matter how deep it is.
+"""
+def get_show_feed(after=None, per_page=SHOWS_PER_PAGE):
+  query = db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.artist_id,
+      Show.venue_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      Venue.name.label('venue_name')
+    ).join(Artist, Artist.id == Show.artist_id
+    ).join(Venue, Venue.id == Show.venue_id)
+  if after is not None:
+    query = query.filter(db.tuple_(Show.start_time, Show.id) > db.tuple_(*after))
+  # one extra row tells us whether there is a next page.
+  shows = query.order_by(Show.start_time, Show.id).limit(per_page + 1).all()
+
+  next_cursor = None
+  if len(shows) > per_page:
+    shows = shows[:per_page]
+    next_cursor = encode_show_cursor(shows[-1])
+  return shows, next_cursor
+
+def encode_show_cursor(show):
+  return '{0}|{1}'.format(show.start_time.isoformat(), show.id)
+
+"""
+  Turns the cursor passed in the query string back into the
+  (start_time, id) key. Returns None if there isn't a valid one.
+"""
+def decode_show_cursor(cursor):
+  if not cursor:
+    return None
+  start_time, _, show_id = cursor.rpartition('|')
+  if not show_id.isdigit():
+    return None
+  try:
+    start_time = datetime.fromisoformat(start_time)
+  except ValueError:
+    return None
+  return start_time, int(show_id)
 
 @app.route('/shows/create')
 def create_shows():
@@ -347,8 +687,11 @@ def create_shows():
 def create_show_submission():
   try:
     # on successful db insert, flash success
-    db.session.add(create_show_from_form(request.form))
+    new_show = create_show_from_form(request.form)
+    db.session.add(new_show)
     db.session.commit()
+    invalidate_details(venue_ids=[new_show.venue_id], artist_ids=[new_show.artist_id])
+    page_cache.bump(Show.__tablename__)
     flash('Show was successfully listed!')
   except:
     # on unsuccessful db insert, flash an error instead.
@@ -361,9 +704,93 @@ def create_show_from_form(form):
   new_show = Show()
   new_show.artist_id = form['artist_id']
   new_show.venue_id = form['venue_id']
-  new_show.start_time = form['start_time']
+  new_show.start_time = parse_show_time(form['start_time'])
   return new_show
 
+"""
+  Parses a start time posted by the show form. Times without 
+  an offset are taken to be in the server's local time.
+"""
+def parse_show_time(value):
+  return datetime.strptime(value, SHOW_TIME_FORMAT).astimezone()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+  help='Format of FILE. Defaults to its extension.')
+@click.option('--batch-size', default=1000, show_default=True,
+  help='Rows saved per transaction.')
+def import_command(kind, file, file_format, batch_size):
+  """Bulk imports venues, artists or shows from a CSV or JSONL FILE.
+
+  Each row holds the fields of the matching create form and is
+  checked with the same rules. Rows that fail are reported with
+  their line number and skipped.
+  """
+  if file_format is None:
+    file_format = 'csv' if file.name.endswith('.csv') else 'jsonl'
+
+  if kind == 'shows':
+    form_class, save_batch = ShowForm, save_shows
+  else:
+    known_genres = {genre.name: genre for genre in Genre.query.all()}
+    form_class = VenueForm if kind == 'venues' else ArtistForm
+    create = create_venue_from_form if kind == 'venues' else create_artist_from_form
+    save_batch = lambda rows: save_models([create(row, known_genres) for row in rows])
+
+  def report_error(number, errors):
+    for field, messages in errors.items():
+      click.echo('line {0}: {1}: {2}'.format(number, field, ' '.join(messages)), err=True)
+
+  def report_progress(imported, failed):
+    click.echo('{0} {1} imported, {2} failed'.format(imported, kind, failed))
+
+  run_import(read_rows(file, file_format), FormValidator(form_class), save_batch,
+    db.session, batch_size, report_error, report_progress)
+  detail_cache.clear()
+  page_cache.clear()
+
+"""
+  Venues and artists are saved through the session so their 
+  search text and genres are filled in as they are on create.
+"""
+def save_models(models):
+  db.session.add_all(models)
+  db.session.commit()
+
+"""
+  Shows are saved with one executemany insert per batch.
+"""
+def save_shows(rows):
+  db.session.execute(Show.__table__.insert(), [{
+    'artist_id': int(row['artist_id']),
+    'venue_id': int(row['venue_id']),
+    'start_time': parse_show_time(row['start_time'])
+  } for row in rows])
+  db.session.commit()
+
+#  Debug
+#  ----------------------------------------------------------------
+
+"""
+  The checkout waits of the connection pool, to size DB_POOL_SIZE 
+  for the number of workers. Only served in debug mode or with 
+  POOL_STATS_ENDPOINT set, and not for SQLite, which has no pool.
+"""
+@app.route('/debug/pool')
+def debug_pool():
+  if not app.config.get('POOL_STATS_ENDPOINT', app.debug):
+    abort(404)
+  stats = get_pool_stats(db.engine)
+  if stats is None:
+    abort(404)
+  return jsonify(stats)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,109 @@
+'''
+  Benchmarks rendering a venue page with 1,000 shows through the
+  datetime filter as it was and as it is now.
+
+  python bench_render.py [--shows 1000] [--repeat 20]
+
+  parsed   the old filter, with start times as strings
+  native   the old filter, with start times as datetimes
+  first    the memoized filter, its cache cleared before each render
+  cached   the memoized filter, warm
+
+  No database is used, the page is rendered from built rows.
+'''
+import argparse
+from datetime import datetime, timedelta, timezone
+import time
+
+import babel
+import dateutil.parser
+
+import config
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--shows', type=int, default=1000)
+  parser.add_argument('--repeat', type=int, default=20)
+  args = parser.parse_args()
+
+  config.SQLALCHEMY_DATABASE_URI = 'sqlite://'
+  # app reads config on import, so it can only be imported now.
+  from flask import render_template
+  from app import app, format_datetime, format_datetime_cached, get_datetime_pattern
+
+  venue = get_venue(args.shows)
+  venue_strings = dict(venue,
+    past_shows=[dict(show, start_time=show['start_time'].isoformat()) for show in venue['past_shows']],
+    upcoming_shows=[dict(show, start_time=show['start_time'].isoformat()) for show in venue['upcoming_shows']])
+
+  def render(data):
+    return render_template('pages/show_venue.html', venue=data)
+
+  def first():
+    format_datetime_cached.cache_clear()
+    get_datetime_pattern.cache_clear()
+    return render(venue)
+
+  with app.test_request_context('/'):
+    filters = app.jinja_env.filters
+    results = []
+    filters['datetime'] = format_datetime_old
+    results.append(('parsed', time_call(lambda: render(venue_strings), args.repeat)))
+    results.append(('native', time_call(lambda: render(venue), args.repeat)))
+    filters['datetime'] = format_datetime
+    results.append(('first', time_call(first, args.repeat)))
+    results.append(('cached', time_call(lambda: render(venue), args.repeat)))
+
+  print('{0} shows'.format(args.shows))
+  print('{0:<10}{1:>12}{2:>10}'.format('filter', 'render ms', 'speedup'))
+  for name, ms in results:
+    print('{0:<10}{1:>12.2f}{2:>9.1f}x'.format(name, ms, results[0][1] / ms))
+
+'''
+  the datetime filter as it was, parsing strings and building
+  the babel pattern on every call.
+'''
+def format_datetime_old(value, format='medium'):
+  date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+'''
+  returns venue page data with shows shows, half of them past,
+  a few hours apart.
+'''
+def get_venue(shows):
+  now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+  def show(number):
+    return {
+      'artist_id': number % 50 + 1,
+      'artist_name': 'Artist {0}'.format(number % 50 + 1),
+      'artist_image_link': 'https://example.com/{0}.jpg'.format(number % 50 + 1),
+      'start_time': now + timedelta(hours=5 * (number - shows // 2))
+    }
+  all_shows = [show(number) for number in range(shows)]
+  past = [s for s in all_shows if s['start_time'] < now]
+  upcoming = [s for s in all_shows if s['start_time'] >= now]
+  return {
+    'id': 1, 'name': 'The Musical Hop', 'genres': ['Jazz', 'Folk'],
+    'address': '1015 Folsom Street', 'city': 'San Francisco', 'state': 'CA',
+    'phone': '123-123-1234', 'website': None, 'facebook_link': None,
+    'seeking_talent': False, 'seeking_description': None,
+    'image_link': 'https://example.com/venue.jpg',
+    'past_shows': past, 'past_shows_count': len(past),
+    'upcoming_shows': upcoming, 'upcoming_shows_count': len(upcoming)
+  }
+
+def time_call(call, repeat):
+  call()
+  start = time.perf_counter()
+  for _ in range(repeat):
+    call()
+  return (time.perf_counter() - start) * 1000 / repeat
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,98 @@
+'''
+  Benchmarks the indexed venue search against the old
+  ILIKE '%term%' match on name.
+
+  python bench_search.py [--database URL] [--rows 10000 100000 1000000]
+
+  By default it uses a throwaway SQLite file, which measures the
+  FTS5 fallback. Point --database at a scratch Postgres database
+  to measure the tsvector index. All Fyyur tables in the database
+  are dropped and recreated.
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import config
+
+WORDS = ['blue', 'note', 'velvet', 'room', 'park', 'square', 'musical', 'hop',
+  'dueling', 'pianos', 'iron', 'hall', 'rose', 'garden', 'lounge', 'cellar',
+  'pier', 'theatre', 'union', 'station', 'echo', 'palace', 'tavern', 'loft']
+CITIES = [('New York', 'NY'), ('San Francisco', 'CA'), ('Chicago', 'IL'),
+  ('Austin', 'TX'), ('Seattle', 'WA'), ('Nashville', 'TN'), ('Denver', 'CO')]
+GENRES = ['Jazz', 'Reggae', 'Swing', 'Classical', 'Folk', 'Rock n Roll',
+  'Blues', 'Hip-Hop', 'Funk', 'Soul', 'Country', 'Punk']
+TERMS = ['velvet', 'iron hall', 'hop', 'austin jazz', 'cellar blues', 'pal']
+INSERT_BATCH = 10000
+REPEAT = 5
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database', default=None)
+  parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+  args = parser.parse_args()
+
+  database = args.database
+  if database is None:
+    database = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+  config.SQLALCHEMY_DATABASE_URI = database
+
+  # app reads config on import, so it can only be imported now.
+  from app import app, db, Venue, venue_search
+  from search import get_search_text
+
+  print('{0:>9}  {1:<14}{2:>12}{3:>12}{4:>10}'.format(
+    'rows', 'term', 'ilike ms', 'index ms', 'speedup'))
+  with app.app_context():
+    for rows in args.rows:
+      db.drop_all()
+      db.create_all()
+      seed_venues(db, Venue, rows, get_search_text)
+      for term in TERMS:
+        ilike = time_search(lambda: Venue.query.filter(
+          Venue.name.ilike('%{0}%'.format(term))).all())
+        indexed = time_search(lambda: venue_search.search(term))
+        print('{0:>9}  {1:<14}{2:>12.2f}{3:>12.2f}{4:>9.1f}x'.format(
+          rows, term, ilike, indexed, ilike / indexed))
+    db.drop_all()
+
+'''
+  inserts rows random venues in batches through Core, so
+  search_text is filled in here rather than by the model events.
+  The genres only go into search_text, they aren't linked.
+'''
+def seed_venues(db, Venue, rows, get_search_text):
+  rng = random.Random(rows)
+  fields = ['name', 'city', 'state', 'genres']
+  for start in range(0, rows, INSERT_BATCH):
+    batch = []
+    for number in range(start, min(start + INSERT_BATCH, rows)):
+      city, state = rng.choice(CITIES)
+      venue = {
+        'name': '{0} {1} {2}'.format(
+          rng.choice(WORDS).title(), rng.choice(WORDS).title(), number),
+        'city': city,
+        'state': state
+      }
+      venue['search_text'] = get_search_text(
+        Row(venue, genres=rng.sample(GENRES, 2)), fields)
+      batch.append(venue)
+    db.session.execute(Venue.__table__.insert(), batch)
+  db.session.commit()
+
+def time_search(search):
+  search()
+  start = time.perf_counter()
+  for _ in range(REPEAT):
+    search()
+  return (time.perf_counter() - start) * 1000 / REPEAT
+
+class Row:
+  def __init__(self, values, **extra):
+    self.__dict__.update(values, **extra)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,97 @@
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
+
+from collections import OrderedDict
+from threading import Lock
+import time
+
+class TTLCache:
+  '''
+    A bounded cache that drops the least recently used entry
+    once it holds maxsize entries. Entries also expire ttl
+    seconds after they are stored. It is safe to share
+    between the threads of one process.
+  '''
+  def __init__(self, maxsize=256, ttl=300):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.lock = Lock()
+
+  '''
+    returns the value stored for key, or default if there
+    isn't one or it has expired.
+  '''
+  def get(self, key, default=None):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return default
+      expires, value = entry
+      if expires <= time.monotonic():
+        del self.entries[key]
+        return default
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self.lock:
+      self.entries[key] = (time.monotonic() + self.ttl, value)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.maxsize:
+        self.entries.popitem(last=False)
+
+  '''
+    returns the value stored for key, calling load to get and
+    store it when it is missing. None is returned but not stored.
+  '''
+  def get_or_set(self, key, load):
+    value = self.get(key)
+    if value is None:
+      value = load()
+      if value is not None:
+        self.set(key, value)
+    return value
+
+  def delete(self, key):
+    with self.lock:
+      self.entries.pop(key, None)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+class PageCache:
+  '''
+    Rendered pages kept by key and by the version of each table
+    they were built from. bump() moves tables to a new version, so
+    every page built from them is rendered again when it is next
+    asked for. Pages also expire after ttl seconds, which covers
+    writes from other processes.
+  '''
+  def __init__(self, maxsize=256, ttl=300):
+    self.pages = TTLCache(maxsize, ttl)
+    self.versions = {}
+    self.lock = Lock()
+
+  def get_versions(self, tables):
+    with self.lock:
+      return tuple(self.versions.get(table, 0) for table in tables)
+
+  def bump(self, *tables):
+    with self.lock:
+      for table in tables:
+        self.versions[table] = self.versions.get(table, 0) + 1
+
+  '''
+    returns the page kept for key at the current versions of
+    tables, calling render to build and keep it when there isn't
+    one. The versions are read before render runs, so a write
+    made while it runs can't leave a stale page current.
+  '''
+  def get_or_render(self, key, tables, render):
+    return self.pages.get_or_set((key, self.get_versions(tables)), render)
+
+  def clear(self):
+    self.pages.clear()
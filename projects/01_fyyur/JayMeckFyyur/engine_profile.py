@@ -0,0 +1,219 @@
+#----------------------------------------------------------------------------#
+# Engine Profile.
+#----------------------------------------------------------------------------#
+
+import logging
+import os
+import re
+from threading import Lock
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+def parse_bool(value):
+  if isinstance(value, str):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+  return bool(value)
+
+PRAGMA = re.compile(r'^\s*(\w+)\s*=\s*([\w-]+)\s*$')
+
+'''
+  returns ((name, value), ...) from 'journal_mode=WAL,busy_timeout=5000',
+  or from a dict or pairs of the same. Names and values are checked,
+  as they end up in PRAGMA statements.
+'''
+def parse_pragmas(value):
+  if isinstance(value, str):
+    value = [item for item in value.split(',') if item.strip()]
+  elif isinstance(value, dict):
+    value = value.items()
+  pragmas = []
+  for item in value:
+    text = item if isinstance(item, str) else '{}={}'.format(*item)
+    match = PRAGMA.match(text)
+    if match is None:
+      raise ValueError('Invalid SQLite pragma: {!r}'.format(text))
+    pragmas.append(match.groups())
+  return tuple(pragmas)
+
+# (attribute, config key and environment variable, parse, default)
+SETTINGS = (
+  ('pool_size', 'DB_POOL_SIZE', int, 5),
+  ('max_overflow', 'DB_MAX_OVERFLOW', int, 10),
+  ('pool_timeout', 'DB_POOL_TIMEOUT', float, 30),
+  ('pool_recycle', 'DB_POOL_RECYCLE', int, 1800),
+  ('pool_pre_ping', 'DB_POOL_PRE_PING', parse_bool, True),
+  # milliseconds, 0 for none
+  ('statement_timeout', 'DB_STATEMENT_TIMEOUT', int, 0),
+  ('sqlite_pragmas', 'DB_SQLITE_PRAGMAS', parse_pragmas, ()),
+  # checkouts waiting longer than this many seconds are logged
+  ('slow_checkout', 'DB_POOL_SLOW_CHECKOUT', float, 0.1),
+)
+
+class EngineProfile:
+  '''
+    How the database engine is built: the size of its connection
+    pool, how long to wait for a connection, how old a connection
+    may get, whether it is pinged before use, the statement timeout
+    and, for SQLite, PRAGMAs run on every new connection.
+
+    Pool settings and the statement timeout apply to server
+    databases, SQLite only takes the pragmas.
+  '''
+  def __init__(self, **settings):
+    for name, key, parse, default in SETTINGS:
+      setattr(self, name, parse(settings.pop(name, default)))
+    if settings:
+      raise TypeError('Unknown engine settings: {}'.format(', '.join(settings)))
+
+  '''
+    returns the profile set by the DB_* keys of config, then by the
+    DB_* environment variables, with overrides taking precedence.
+  '''
+  @classmethod
+  def from_config(cls, config, environ=os.environ, **overrides):
+    settings = {}
+    for name, key, parse, default in SETTINGS:
+      if name in overrides:
+        settings[name] = overrides.pop(name)
+      elif config.get(key) is not None:
+        settings[name] = config[key]
+      elif environ.get(key):
+        settings[name] = environ[key]
+    settings.update(overrides)
+    return cls(**settings)
+
+  def __repr__(self):
+    return 'EngineProfile({})'.format(', '.join('{}={!r}'.format(name, getattr(self, name))
+      for name, key, parse, default in SETTINGS))
+
+  '''
+    returns the create_engine() options for database_uri
+  '''
+  def engine_options(self, database_uri):
+    drivername = make_url(database_uri).drivername
+    if drivername.startswith('sqlite'):
+      return {}
+    options = {
+      'poolclass': TimedQueuePool,
+      'pool_size': self.pool_size,
+      'max_overflow': self.max_overflow,
+      'pool_timeout': self.pool_timeout,
+      'pool_recycle': self.pool_recycle,
+      'pool_pre_ping': self.pool_pre_ping
+    }
+    if self.statement_timeout and drivername.startswith('postgres'):
+      options['connect_args'] = {
+        'options': '-c statement_timeout={:d}'.format(self.statement_timeout)
+      }
+    return options
+
+  '''
+    sets SQLALCHEMY_ENGINE_OPTIONS for the database of app, keeping
+    any option it already sets. Call it before the engine is made.
+  '''
+  def init_app(self, app):
+    options = self.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.extensions['engine_profile'] = self
+
+  '''
+    applies what can only be set on the engine once it is made:
+    the SQLite pragmas and the slow checkout threshold.
+  '''
+  def configure(self, engine):
+    if engine.dialect.name == 'sqlite' and self.sqlite_pragmas:
+      event.listen(engine, 'connect', self.set_pragmas)
+    if isinstance(engine.pool, TimedQueuePool):
+      engine.pool.wait_stats.slow_checkout = self.slow_checkout
+    return engine
+
+  def set_pragmas(self, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in self.sqlite_pragmas:
+      cursor.execute('PRAGMA {}={}'.format(name, value))
+    cursor.close()
+
+class PoolWaitStats:
+  '''
+    How long checkouts from a pool waited for a connection, whether
+    for one to be returned or for a new one to be opened.
+  '''
+  def __init__(self, slow_checkout=0.1):
+    self.slow_checkout = slow_checkout
+    self.lock = Lock()
+    self.checkouts = 0
+    self.slow_checkouts = 0
+    self.timeouts = 0
+    self.wait_seconds = 0.0
+    self.max_wait_seconds = 0.0
+
+  def add(self, seconds, timed_out=False):
+    with self.lock:
+      self.checkouts += 1
+      self.wait_seconds += seconds
+      self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+      if timed_out:
+        self.timeouts += 1
+      elif seconds > self.slow_checkout:
+        self.slow_checkouts += 1
+
+  def as_dict(self):
+    with self.lock:
+      return {
+        'checkouts': self.checkouts,
+        'slow_checkouts': self.slow_checkouts,
+        'timeouts': self.timeouts,
+        'wait_ms_total': round(self.wait_seconds * 1000, 1),
+        'wait_ms_mean': round(self.wait_seconds * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+        'wait_ms_max': round(self.max_wait_seconds * 1000, 1)
+      }
+
+class TimedQueuePool(QueuePool):
+  '''
+    A QueuePool that times every checkout in wait_stats, and logs
+    the ones slower than wait_stats.slow_checkout.
+  '''
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.wait_stats = PoolWaitStats()
+
+  def _do_get(self):
+    start = time.perf_counter()
+    try:
+      connection = super()._do_get()
+    except exc.TimeoutError:
+      self.wait_stats.add(time.perf_counter() - start, timed_out=True)
+      logger.warning('Timed out waiting for a database connection: %s', self.status())
+      raise
+    seconds = time.perf_counter() - start
+    self.wait_stats.add(seconds)
+    if seconds > self.wait_stats.slow_checkout:
+      logger.warning('Waited %.1f ms for a database connection: %s', seconds * 1000, self.status())
+    return connection
+
+  def recreate(self):
+    pool = super().recreate()
+    pool.wait_stats = self.wait_stats
+    return pool
+
+'''
+  returns the checkout wait stats of the pool of engine with its
+  current size and use, or None if it isn't a TimedQueuePool.
+'''
+def get_pool_stats(engine):
+  pool = engine.pool
+  if not isinstance(pool, TimedQueuePool):
+    return None
+  stats = pool.wait_stats.as_dict()
+  stats.update({
+    'size': pool.size(),
+    'checked_out': pool.checkedout(),
+    'overflow': pool.overflow()
+  })
+  return stats
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+'''
+  Streaming bulk import used by the `flask import` command.
+
+  Rows are read one at a time from a CSV or JSONL file, checked
+  against the rules of a form in forms.py and saved in batches,
+  so a file of any size is imported without holding it in memory.
+'''
+
+import csv
+import json
+from itertools import islice
+from werkzeug.datastructures import MultiDict
+from wtforms import SelectMultipleField
+from wtforms.validators import DataRequired
+
+'''
+  yields (line number, row) for each record in file.
+  A JSONL line that isn't a JSON object is yielded as a None row.
+'''
+def read_rows(file, file_format):
+  if file_format == 'csv':
+    reader = csv.DictReader(file)
+    for row in reader:
+      yield reader.line_num, row
+    return
+
+  for number, line in enumerate(file, 1):
+    if not line.strip():
+      continue
+    try:
+      row = json.loads(line)
+    except ValueError:
+      row = None
+    yield number, row if isinstance(row, dict) else None
+
+def batched(iterable, size):
+  iterator = iter(iterable)
+  batch = list(islice(iterator, size))
+  while batch:
+    yield batch
+    batch = list(islice(iterator, size))
+
+class FormValidator:
+  '''
+    Checks rows against form_class, the same way a submission
+    of that form is checked. Calling it with a row returns
+    (formdata, errors), errors being None for a valid row.
+  '''
+  def __init__(self, form_class):
+    form = form_class(formdata=None, meta={'csrf': False})
+    self.form_class = form_class
+    self.field_names = list(form._fields)
+    # fields that take several values, like genres. In a file
+    # these are given as a list or a comma separated string.
+    self.multiple = {name for name, field in form._fields.items()
+      if isinstance(field, SelectMultipleField)}
+
+  def __call__(self, row):
+    if row is None:
+      return None, {'row': ['Not a JSON object.']}
+
+    formdata = self.get_formdata(row)
+    form = self.form_class(formdata=formdata, meta={'csrf': False})
+    form.validate()
+    errors = dict(form.errors)
+    for field in form:
+      required = any(isinstance(validator, DataRequired) for validator in field.validators)
+      # DataRequired hides why a value couldn't be read.
+      if field.process_errors:
+        errors[field.name] = list(field.process_errors)
+      # a missing field would otherwise be validated on its default.
+      elif required and not field.raw_data:
+        errors[field.name] = ['This field is required.']
+    return formdata, errors or None
+
+  def get_formdata(self, row):
+    formdata = MultiDict()
+    for name in self.field_names:
+      value = row.get(name)
+      if value is None:
+        value = ''
+      if name in self.multiple and isinstance(value, str):
+        value = [item.strip() for item in value.split(',') if item.strip()]
+      if isinstance(value, list):
+        for item in value:
+          formdata.add(name, str(item))
+      else:
+        formdata.add(name, str(value))
+    return formdata
+
+'''
+  Validates rows and hands the valid ones to save_batch in
+  lists of batch_size. save_batch must save and commit the
+  whole list or raise. A batch that fails is rolled back and
+  saved again a row at a time, so only the rows at fault fail.
+  Errors are passed to report_error(line number, errors) and
+  progress to report_progress(imported, failed) after each batch.
+  returns (imported, failed)
+'''
+def run_import(rows, validate, save_batch, session, batch_size,
+    report_error, report_progress):
+  imported = failed = 0
+  for batch in batched(rows, batch_size):
+    valid = []
+    for number, row in batch:
+      formdata, errors = validate(row)
+      if errors:
+        failed += 1
+        report_error(number, errors)
+      else:
+        valid.append((number, formdata))
+
+    try:
+      if valid:
+        save_batch([formdata for _, formdata in valid])
+      imported += len(valid)
+    except Exception:
+      session.rollback()
+      for number, formdata in valid:
+        try:
+          save_batch([formdata])
+          imported += 1
+        except Exception as error:
+          session.rollback()
+          failed += 1
+          report_error(number, {'row': [str(error).splitlines()[0]]})
+    report_progress(imported, failed)
+  return imported, failed
@@ -0,0 +1,87 @@
+"""normalize venue and artist genres into a genre table
+
+Revision ID: 3e8c61b0f7d4
+Revises: d7b2e5c14f3a
+Create Date: 2020-03-31 15:22:47.090136
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8c61b0f7d4'
+down_revision = 'd7b2e5c14f3a'
+branch_labels = None
+depends_on = None
+
+# (owner table, link table, link column)
+GENRE_LINKS = [
+    ('Venue', 'venue_genres', 'venue_id'),
+    ('Artist', 'artist_genres', 'artist_id'),
+]
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for owner, link, column in GENRE_LINKS:
+        op.create_table(link,
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([column], [owner + '.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint(column, 'genre_id')
+        )
+        op.create_index('ix_{0}_genre_id_{1}'.format(link, column), link, ['genre_id', column], unique=False)
+
+    connection = op.get_bind()
+    genre_ids = {}
+    for owner, link, column in GENRE_LINKS:
+        rows = connection.execute(sa.text('SELECT id, genres FROM "{0}"'.format(owner))).fetchall()
+        links = []
+        for owner_id, genres in rows:
+            for name in split_genres(genres):
+                if name not in genre_ids:
+                    genre_ids[name] = connection.execute(
+                        genre.insert().values(name=name)).inserted_primary_key[0]
+                links.append({column: owner_id, 'genre_id': genre_ids[name]})
+        if links:
+            op.bulk_insert(sa.table(link, sa.column(column), sa.column('genre_id')), links)
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    connection = op.get_bind()
+    for owner, link, column in GENRE_LINKS:
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.add_column(sa.Column('genres', sa.String(length=120), nullable=True))
+        rows = connection.execute(sa.text(
+            'SELECT l.{1}, g.name FROM {0} l JOIN "Genre" g ON g.id = l.genre_id '
+            'ORDER BY l.{1}, g.name'.format(link, column))).fetchall()
+        genres = {}
+        for owner_id, name in rows:
+            genres.setdefault(owner_id, []).append(name)
+        for owner_id, names in genres.items():
+            connection.execute(sa.text('UPDATE "{0}" SET genres = :genres WHERE id = :id'.format(owner)),
+                genres=','.join(names), id=owner_id)
+        op.drop_index('ix_{0}_genre_id_{1}'.format(link, column), table_name=link)
+        op.drop_table(link)
+    op.drop_table('Genre')
+
+
+'''
+    Splits a stored genres value into names. Most rows are comma
+    joined, but venues created from the form stored a Postgres
+    array literal such as {Jazz,"Rock n Roll"}.
+'''
+def split_genres(genres):
+    if not genres:
+        return []
+    names = [name.strip().strip('"').strip() for name in genres.strip().strip('{}').split(',')]
+    return list(dict.fromkeys(name for name in names if name))
@@ -0,0 +1,24 @@
+"""index shows on start_time and id for the show feed
+
+Revision ID: 5c0e3a9f6b12
+Revises: bf3f07246aa9
+Create Date: 2020-03-20 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0e3a9f6b12'
+down_revision = 'bf3f07246aa9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Shows_start_time_id', 'Shows', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Shows_start_time_id', table_name='Shows')
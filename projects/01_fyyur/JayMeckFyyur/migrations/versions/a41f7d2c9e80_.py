@@ -0,0 +1,36 @@
+"""store show start_time as a timestamp and index it per venue and artist
+
+Revision ID: a41f7d2c9e80
+Revises: 5c0e3a9f6b12
+Create Date: 2020-03-24 18:40:02.615337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f7d2c9e80'
+down_revision = '5c0e3a9f6b12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('Shows', 'start_time',
+               existing_type=sa.String(),
+               type_=sa.DateTime(timezone=True),
+               existing_nullable=True,
+               postgresql_using='start_time::timestamp with time zone')
+    op.create_index('ix_Shows_venue_id_start_time', 'Shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Shows_artist_id_start_time', 'Shows', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows')
+    op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows')
+    op.alter_column('Shows', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.String(),
+               existing_nullable=True,
+               postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI:SS')")
@@ -0,0 +1,24 @@
+"""index artists by lower(name) for the paged artist list
+
+Revision ID: c58d1e7a4b29
+Revises: 3e8c61b0f7d4
+Create Date: 2020-04-07 11:12:40.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c58d1e7a4b29'
+down_revision = '3e8c61b0f7d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Artist_sort_name_id', 'Artist', [sa.text('lower(name)'), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_sort_name_id', table_name='Artist')
@@ -0,0 +1,70 @@
+"""full text search index on venues and artists
+
+Revision ID: d7b2e5c14f3a
+Revises: a41f7d2c9e80
+Create Date: 2020-03-27 11:05:19.804471
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b2e5c14f3a'
+down_revision = 'a41f7d2c9e80'
+branch_labels = None
+depends_on = None
+
+SEARCH_TABLES = ['Venue', 'Artist']
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in SEARCH_TABLES:
+        op.add_column(table, sa.Column('search_text', sa.Text(), nullable=True))
+        op.execute(
+            'UPDATE "{0}" SET search_text = trim('
+            "coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || "
+            "coalesce(state, '') || ' ' || coalesce(genres, ''))".format(table))
+        if dialect == 'postgresql':
+            op.execute(
+                'CREATE INDEX "ix_{0}_search" ON "{0}" '
+                "USING gin (to_tsvector('simple', search_text))".format(table))
+        elif dialect == 'sqlite':
+            create_sqlite_search(table)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in SEARCH_TABLES:
+        if dialect == 'postgresql':
+            op.execute('DROP INDEX "ix_{0}_search"'.format(table))
+        elif dialect == 'sqlite':
+            for trigger in ['ai', 'ad', 'au']:
+                op.execute('DROP TRIGGER "{0}_search_{1}"'.format(table, trigger))
+            op.execute('DROP TABLE "{0}_search"'.format(table))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('search_text')
+
+
+def create_sqlite_search(table):
+    fts = table + '_search'
+    op.execute(
+        'CREATE VIRTUAL TABLE "{1}" USING fts5('
+        "search_text, content='{0}', content_rowid='id')".format(table, fts))
+    op.execute(
+        'CREATE TRIGGER "{1}_ai" AFTER INSERT ON "{0}" BEGIN '
+        'INSERT INTO "{1}"(rowid, search_text) VALUES (new.id, new.search_text); '
+        'END'.format(table, fts))
+    op.execute(
+        'CREATE TRIGGER "{1}_ad" AFTER DELETE ON "{0}" BEGIN '
+        'INSERT INTO "{1}"("{1}", rowid, search_text) '
+        "VALUES ('delete', old.id, old.search_text); "
+        'END'.format(table, fts))
+    op.execute(
+        'CREATE TRIGGER "{1}_au" AFTER UPDATE ON "{0}" BEGIN '
+        'INSERT INTO "{1}"("{1}", rowid, search_text) '
+        "VALUES ('delete', old.id, old.search_text); "
+        'INSERT INTO "{1}"(rowid, search_text) VALUES (new.id, new.search_text); '
+        'END'.format(table, fts))
+    op.execute('INSERT INTO "{0}"("{0}") VALUES (\'rebuild\')'.format(fts))
@@ -0,0 +1,148 @@
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+'''
+  Full text search for venues and artists.
+
+  Each searchable model keeps a search_text column holding the
+  text of the fields it is searched on. On Postgres that column
+  is covered by a GIN index on its tsvector, on SQLite (local
+  and test runs) triggers mirror it into an FTS5 table. Any other
+  database falls back to the old ILIKE match on name.
+'''
+
+import re
+from sqlalchemy import DDL, event, func, text
+
+# Most results a search will ever rank and return.
+SEARCH_RESULT_LIMIT = 200
+SEARCH_PER_PAGE = 20
+
+class SearchIndex:
+  '''
+    model: the mapped class to search, it must have a search_text column.
+    fields: names of the attributes that make up search_text.
+  '''
+  def __init__(self, db, model, fields):
+    self.db = db
+    self.model = model
+    self.fields = fields
+    self.table_name = model.__tablename__
+    self.fts_name = self.table_name + '_search'
+    event.listen(model, 'before_insert', self.update_search_text)
+    event.listen(model, 'before_update', self.update_search_text)
+    for statement in self.get_ddl():
+      event.listen(model.__table__, 'after_create', statement)
+    event.listen(model.__table__, 'before_drop',
+      DDL('DROP TABLE IF EXISTS "{0}"'.format(self.fts_name)).execute_if(dialect='sqlite'))
+
+  '''
+    keeps search_text in step with the fields it is built from.
+  '''
+  def update_search_text(self, mapper, connection, target):
+    target.search_text = get_search_text(target, self.fields)
+
+  '''
+    The index DDL for each database, run after the table is created.
+    Migrations create the same objects for existing databases.
+  '''
+  def get_ddl(self):
+    table, fts = self.table_name, self.fts_name
+    postgres = [
+      'CREATE INDEX "ix_{0}_search" ON "{0}" '
+      "USING gin (to_tsvector('simple', search_text))".format(table)
+    ]
+    sqlite = [
+      'CREATE VIRTUAL TABLE "{1}" USING fts5('
+      "search_text, content='{0}', content_rowid='id')",
+      'CREATE TRIGGER "{1}_ai" AFTER INSERT ON "{0}" BEGIN '
+      'INSERT INTO "{1}"(rowid, search_text) VALUES (new.id, new.search_text); '
+      'END',
+      'CREATE TRIGGER "{1}_ad" AFTER DELETE ON "{0}" BEGIN '
+      'INSERT INTO "{1}"("{1}", rowid, search_text) '
+      "VALUES ('delete', old.id, old.search_text); "
+      'END',
+      'CREATE TRIGGER "{1}_au" AFTER UPDATE ON "{0}" BEGIN '
+      'INSERT INTO "{1}"("{1}", rowid, search_text) '
+      "VALUES ('delete', old.id, old.search_text); "
+      'INSERT INTO "{1}"(rowid, search_text) VALUES (new.id, new.search_text); '
+      'END'
+    ]
+    return [DDL(statement).execute_if(dialect='postgresql') for statement in postgres] + \
+      [DDL(statement.format(table, fts)).execute_if(dialect='sqlite') for statement in sqlite]
+
+  '''
+    Searches for the term and returns one page of results, best
+    match first, as the results object the search pages expect.
+    count is capped at SEARCH_RESULT_LIMIT.
+  '''
+  def search(self, term, page=1, per_page=SEARCH_PER_PAGE):
+    ids = self.get_ranked_ids(term, SEARCH_RESULT_LIMIT)
+    start = (max(page, 1) - 1) * per_page
+    page_ids = ids[start:start + per_page]
+
+    items = []
+    if page_ids:
+      by_id = {item.id: item for item in
+        self.model.query.filter(self.model.id.in_(page_ids)).all()}
+      items = [by_id[item_id] for item_id in page_ids if item_id in by_id]
+    return {
+      'count': len(ids),
+      'data': items,
+      'page': page,
+      'has_next': start + per_page < len(ids)
+    }
+
+  '''
+    returns the ids of at most limit matches, best match first.
+  '''
+  def get_ranked_ids(self, term, limit):
+    words = re.findall(r'\w+', term.lower())
+    dialect = self.db.session.get_bind().dialect.name
+    if words and dialect == 'postgresql':
+      return self.get_postgres_ids(words, limit)
+    if words and dialect == 'sqlite':
+      return self.get_sqlite_ids(words, limit)
+    return self.get_ilike_ids(term, limit)
+
+  def get_postgres_ids(self, words, limit):
+    vector = func.to_tsvector('simple', self.model.search_text)
+    # every word has to match, the last one may be partly typed.
+    query = func.to_tsquery('simple', ' & '.join(word + ':*' for word in words))
+    rows = self.db.session.query(self.model.id
+      ).filter(vector.op('@@')(query)
+      ).order_by(func.ts_rank(vector, query).desc(), self.model.id
+      ).limit(limit).all()
+    return [row.id for row in rows]
+
+  def get_sqlite_ids(self, words, limit):
+    query = ' '.join('"{0}"*'.format(word) for word in words)
+    rows = self.db.session.execute(text(
+      'SELECT rowid FROM "{0}" WHERE "{0}" MATCH :query '
+      'ORDER BY rank LIMIT :limit'.format(self.fts_name)),
+      {'query': query, 'limit': limit})
+    return [row[0] for row in rows]
+
+  def get_ilike_ids(self, term, limit):
+    look_for = '%{0}%'.format(term)
+    rows = self.db.session.query(self.model.id
+      ).filter(self.model.name.ilike(look_for)
+      ).order_by(self.model.name, self.model.id
+      ).limit(limit).all()
+    return [row.id for row in rows]
+
+'''
+  joins the values of fields on target into the text that is indexed.
+  Fields holding a list, such as the genres relationship, add 
+  the name of each item.
+'''
+def get_search_text(target, fields):
+  values = []
+  for field in fields:
+    value = getattr(target, field)
+    if isinstance(value, (list, tuple)):
+      values.extend(str(getattr(item, 'name', item)) for item in value)
+    elif value:
+      values.append(str(value))
+  return ' '.join(values)
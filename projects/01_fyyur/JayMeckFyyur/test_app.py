@@ -0,0 +1,114 @@
+#----------------------------------------------------------------------------#
+# Query budget tests.
+#----------------------------------------------------------------------------#
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import config
+
+# app reads config on import, so the test database is set first.
+database_dir = tempfile.mkdtemp()
+config.SQLALCHEMY_DATABASE_URI = 'sqlite:///{0}'.format(os.path.join(database_dir, 'fyyur_test.db'))
+
+from app import (app, db, query_stats, page_cache, detail_cache, sep_shows,
+  get_show_artist_query, format_datetime, Genre, Venue, Artist, Show)
+
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX')]
+
+class FyyurTestCase(unittest.TestCase):
+  '''
+    Seeds a dozen venues and artists with past and upcoming shows,
+    enough that a query per row would go over every budget.
+  '''
+  def setUp(self):
+    self.client = app.test_client()
+    db.create_all()
+    jazz, folk = Genre(name='Jazz'), Genre(name='Folk')
+    now = datetime.now(timezone.utc)
+    for number in range(12):
+      city, state = CITIES[number % len(CITIES)]
+      venue = Venue(name='Venue {0}'.format(number), city=city, state=state,
+        genres=[jazz, folk] if number % 2 else [jazz])
+      artist = Artist(name='Artist {0}'.format(number), city=city, state=state,
+        genres=[folk])
+      db.session.add_all([venue, artist])
+      for hours in (-48, -24, 24, 48):
+        db.session.add(Show(venue=venue, artist=artist, start_time=now + timedelta(hours=hours)))
+    db.session.commit()
+    page_cache.clear()
+    detail_cache.clear()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+
+  def get(self, url):
+    response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+    return response
+
+  def test_venues_query_budget(self):
+    with query_stats.expect(1):
+      self.get('/venues')
+    with query_stats.expect(0):
+      self.get('/venues')
+
+  def test_venues_by_genre_query_budget(self):
+    with query_stats.expect(1):
+      self.get('/venues?genre=Folk')
+
+  def test_shows_query_budget(self):
+    with query_stats.expect(1):
+      self.get('/shows')
+    with query_stats.expect(0):
+      self.get('/shows')
+
+  def test_artists_query_budget(self):
+    with query_stats.expect(2):
+      self.get('/artists')
+
+  def test_show_venue_query_budget(self):
+    with query_stats.expect(2):
+      self.get('/venues/1')
+    with query_stats.expect(0):
+      self.get('/venues/1')
+
+  def test_show_artist_query_budget(self):
+    with query_stats.expect(2):
+      self.get('/artists/1')
+
+  def test_sep_shows_query_budget(self):
+    with query_stats.expect(1):
+      shows = sep_shows(Show.venue_id, 1, get_show_artist_query())
+    self.assertEqual(shows['past_shows_count'], 2)
+    self.assertEqual(shows['upcoming_shows_count'], 2)
+
+  def test_debug_pool_without_pool(self):
+    self.assertEqual(self.client.get('/debug/pool').status_code, 404)
+
+  def test_query_stats_repeated(self):
+    with query_stats.expect(12) as queries:
+      for venue_id in range(1, 13):
+        Venue.query.get(venue_id)
+    self.assertEqual(queries.count, 12)
+    self.assertEqual([times for statement, times in queries.repeated()], [12])
+
+  def test_query_budget_exceeded(self):
+    with self.assertRaises(AssertionError):
+      with query_stats.expect(0):
+        self.get('/venues')
+
+class FormatDatetimeTestCase(unittest.TestCase):
+  def test_same_instant_in_other_zones(self):
+    paris = datetime(2020, 5, 21, 20, 0, tzinfo=timezone(timedelta(hours=2)))
+    london = datetime(2020, 5, 21, 18, 0, tzinfo=timezone.utc)
+    self.assertEqual(paris, london)
+    with app.app_context():
+      self.assertIn('8:00PM', format_datetime(paris))
+      self.assertIn('6:00PM', format_datetime(london))
+
+if __name__ == '__main__':
+  unittest.main()
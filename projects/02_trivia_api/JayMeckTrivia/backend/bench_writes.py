@@ -0,0 +1,81 @@
+'''
+Benchmarks POST /questions and DELETE /questions/<id> as the
+questions table grows, to check that a write costs the same
+however many questions there are.
+
+    python bench_writes.py [--database URL] [--rows 1000 10000 100000]
+
+By default each size gets a throwaway SQLite file. --database
+points it at a scratch database instead, whose questions table
+is emptied and refilled for each size. The "read all ms" column
+times Question.query.all(), which each write used to run.
+'''
+import argparse
+import os
+import tempfile
+import time
+
+from flaskr import create_app
+from models import db, Question
+
+INSERT_BATCH = 10000
+REPEAT = 50
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database', default=None)
+  parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+  args = parser.parse_args()
+
+  print('{0:>9}{1:>12}{2:>14}{3:>15}'.format(
+    'rows', 'add ms', 'delete ms', 'read all ms'))
+  for rows in args.rows:
+    database = args.database
+    if database is None:
+      database = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_writes.db')
+    app = create_app({'DATABASE_PATH': database})
+    client = app.test_client()
+    with app.app_context():
+      seed_questions(rows)
+      read_all = time_call(lambda: Question.query.all(), 5)
+
+    created = []
+    add = time_call(lambda: created.append(client.post('/questions', json={
+      'question': 'Benchmark question?',
+      'answer': 'Benchmark answer',
+      'category': 1,
+      'difficulty': 1
+    }).get_json()['created']), REPEAT)
+    delete = time_call(lambda: client.delete(
+      '/questions/{0}'.format(created.pop())), REPEAT)
+    print('{0:>9}{1:>12.2f}{2:>14.2f}{3:>15.2f}'.format(rows, add, delete, read_all))
+
+'''
+empties the questions table and inserts rows questions
+in batches through Core.
+'''
+def seed_questions(rows):
+  db.session.query(Question).delete()
+  for start in range(0, rows, INSERT_BATCH):
+    db.session.execute(Question.__table__.insert(), [{
+      'question': 'Question {0}?'.format(number),
+      'answer': 'Answer {0}'.format(number),
+      'category': number % 6 + 1,
+      'difficulty': number % 5 + 1
+    } for number in range(start, min(start + INSERT_BATCH, rows))])
+  db.session.commit()
+
+'''
+returns the mean milliseconds of call, run repeat times after
+one untimed run.
+'''
+def time_call(call, repeat):
+  call()
+  start = time.perf_counter()
+  for _ in range(repeat):
+    call()
+  return (time.perf_counter() - start) * 1000 / repeat
+
+if __name__ == '__main__':
+  main()
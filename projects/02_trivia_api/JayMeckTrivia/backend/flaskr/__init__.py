@@ -1,17 +1,36 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
+import time
 
-from models import setup_db, Question, Category
+from models import setup_db, Question, Category, db, database_path
+from pool_stats import get_pool_stats
+from .sampler import QuestionSampler
+from .quiz_sessions import get_session_store
+from .categories import CategoryRegistry, register
+from .search import QuestionSearch
+from .bulk import (read_items, validate_question, batched, export_ndjson,
+  BULK_BATCH_SIZE, NDJSON)
+
+# Made before any app creates the tables, so the index is created with them.
+question_search = QuestionSearch(db, Question)
 
 ITEMS_PER_PAGE = 10
+MAX_ITEMS_PER_PAGE = 100
+# How long a cached question count is trusted. Counts follow every
+# write in this process, this covers the other processes.
+COUNT_CACHE_SECONDS = 60
+# How long clients and proxies may reuse /categories before revalidating.
+CATEGORIES_MAX_AGE = 60
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  app.config['QUIZ_SESSION_DB'] = os.environ.get('QUIZ_SESSION_DB')
+  if test_config is not None:
+    app.config.from_mapping(test_config)
+  setup_db(app, app.config.get('DATABASE_PATH', database_path))
   CORS(app)
 
   def get_body(request):
@@ -20,11 +39,70 @@ def create_app(test_config=None):
       abort(400)
     return body
 
-  def paginate_items(items, page):
-    start = (page - 1) * ITEMS_PER_PAGE
-    end = start + ITEMS_PER_PAGE
-    formatted_items = [item.format() for item in items]
-    return formatted_items[start:end]
+  '''
+  Returns a category id sent in a request as an int, or None if it 
+  isn't one. The frontend sends ids taken from the keys of the 
+  categories object, which are strings.
+  '''
+  def get_category_id(value):
+    try:
+      return int(value)
+    except (TypeError, ValueError):
+      return None
+
+  '''
+  Returns one page of the questions in query, formatted. 
+  The page is read in SQL, either by ?page= with LIMIT/OFFSET, 
+  or by ?after=<id of the last question seen>, which seeks past 
+  that id on the primary key so deep pages cost no more than 
+  the first. ?per_page= sets the page size, up to MAX_ITEMS_PER_PAGE. 
+  A ranked query keeps its own order and is only read by ?page=.
+  '''
+  def paginate_questions(query, ranked=False):
+    per_page = request.args.get('per_page', ITEMS_PER_PAGE, type=int)
+    per_page = min(max(per_page, 1), MAX_ITEMS_PER_PAGE)
+    after = None
+    if not ranked:
+      after = request.args.get('after', None, type=int)
+      query = query.order_by(Question.id)
+    if after is not None:
+      query = query.filter(Question.id > after)
+    else:
+      page = max(request.args.get('page', 1, type=int), 1)
+      query = query.offset((page - 1) * per_page)
+    questions = query.limit(per_page).all()
+    return [question.format() for question in questions]
+
+  question_counts = {}
+  quiz_sampler = QuestionSampler(
+    lambda: db.session.query(Question.id, Question.category).all())
+  quiz_sessions = get_session_store(app.config)
+  categories = CategoryRegistry(Category)
+  register(app, categories)
+  app.extensions['categories'] = categories
+
+  '''
+  Returns the COUNT of the questions in query, cached under key 
+  until a question is added or deleted.
+  '''
+  def count_questions(key, query):
+    now = time.monotonic()
+    cached = question_counts.get(key)
+    if cached is None or cached[0] < now:
+      cached = (now + COUNT_CACHE_SECONDS, query.count())
+      question_counts[key] = cached
+    return cached[1]
+
+  '''
+  Keeps the cached counts in step with a question added (delta 1) 
+  or deleted (delta -1) in category, so a write doesn't have to 
+  count the table again.
+  '''
+  def update_counts(category, delta):
+    for key in ('all', ('category', category)):
+      cached = question_counts.get(key)
+      if cached is not None:
+        question_counts[key] = (cached[0], cached[1] + delta)
 
   '''
   The after_request decorator to set Access-Control-Allow
@@ -37,16 +115,22 @@ def create_app(test_config=None):
 
   '''
   An endpoint to handle GET requests 
-  for all available categories.
+  for all available categories. 
+
+  The response carries an ETag of the categories, a request 
+  with a matching If-None-Match gets a 304 with no body.
   '''
   @app.route('/categories', methods=['GET'])
   def get_trivia_categories():
-    categories = Category.query.all()
-    formatted_categories = {cat.id:cat.type for cat in categories}
-    return jsonify({
+    all_categories, etag = categories.load()
+    response = jsonify({
       'success': True,
-      'categories':formatted_categories
+      'categories':all_categories
     })
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CATEGORIES_MAX_AGE
+    return response.make_conditional(request)
 
   '''
   An endpoint to handle GET requests for questions, 
@@ -56,25 +140,22 @@ def create_app(test_config=None):
   '''
   @app.route('/questions', methods=['GET'])
   def get_trivia_questions():
-    page=request.args.get('page',1, type=int)
-    questions = Question.query.all()
-    paginated_questions = paginate_items(questions, page)
+    paginated_questions = paginate_questions(Question.query)
     if(len(paginated_questions)==0):
       abort(404)
-    current_category = paginated_questions[1]['category']
-    categories = Category.query.all()
-    formatted_categories = {cat.id:cat.type for cat in categories}
+    current_category = paginated_questions[0]['category']
     return jsonify({
       'success': True,
-      'total_questions': len(questions),
+      'total_questions': count_questions('all', Question.query),
       'questions': paginated_questions,
-      'categories': formatted_categories,
+      'categories': categories.get(),
       'current_category': current_category
     })
 
 
   '''
-  Deletes the question that maps to the id passed. 
+  Deletes the question that maps to the id passed 
+  and returns it.
   '''
 
   @app.route('/questions/<int:question_id>', methods=['DELETE'])
@@ -84,12 +165,14 @@ def create_app(test_config=None):
       abort(404)
 
     try:
-      remaining_questions = Question.query.all()
       question.delete()
+      update_counts(question.category, -1)
+      quiz_sampler.remove(question_id, question.category)
       return jsonify({
         'success': True,
         'deleted':question_id,
-        'total_questions':len(remaining_questions)
+        'question': question.format(),
+        'total_questions':count_questions('all', Question.query)
       })
     except:
       abort(422)
@@ -97,7 +180,7 @@ def create_app(test_config=None):
 
   '''
   Creates a new question using the json body passed 
-  in the request. 
+  in the request and returns it.
   '''
 
   @app.route('/questions', methods=['POST'])
@@ -114,34 +197,118 @@ def create_app(test_config=None):
     try:
       new_question = Question(question, answer, category, difficulty)
       new_question.insert()
-
-      all_questions = Question.query.all()
+      update_counts(new_question.category, 1)
+      quiz_sampler.add(new_question.id, new_question.category)
 
       return jsonify({
         'success':True,
         'created': new_question.id,
-        # 'questions': [question.format() for question in all_questions],
-        'total_questions': len(all_questions)
+        'question': new_question.format(),
+        'total_questions': count_questions('all', Question.query)
       })
     except:
       abort(422)
 
+  '''
+  Saves questions, a list of (index, question values), in one 
+  transaction. If that fails each question is saved on its own, 
+  so only the ones at fault fail, and their errors are added to 
+  errors. Returns the number saved.
+  '''
+  def save_questions(questions, errors):
+    try:
+      new_questions = [Question(**values) for _, values in questions]
+      db.session.add_all(new_questions)
+      db.session.flush()
+      # read before the commit expires them.
+      saved = [(question.id, question.category) for question in new_questions]
+      db.session.commit()
+    except Exception:
+      db.session.rollback()
+      if len(questions) == 1:
+        index, _ = questions[0]
+        errors.append({'index': index, 'errors': ['could not be saved']})
+        return 0
+      return sum(save_questions([question], errors) for question in questions)
+
+    for question_id, category in saved:
+      quiz_sampler.add(question_id, category)
+    return len(saved)
+
+  '''
+  Creates many questions at once from a JSON array of questions, 
+  or from NDJSON (one question per line) sent with the 
+  application/x-ndjson content type, which is read as it arrives. 
+  Each question is checked like one sent to POST /questions and 
+  the valid ones are inserted BULK_BATCH_SIZE to a transaction. 
+  Returns how many were created and, for every question that 
+  wasn't, its index in the body and the errors.
+  '''
+  @app.route('/questions/bulk', methods=['POST'])
+  def add_trivia_questions_bulk():
+    try:
+      items = read_items(request)
+    except ValueError:
+      abort(400)
+
+    category_ids = set(categories.get())
+    created = 0
+    errors = []
+    for batch in batched(items, BULK_BATCH_SIZE):
+      valid = []
+      for index, item in batch:
+        values, item_errors = validate_question(item, category_ids)
+        if item_errors:
+          errors.append({'index': index, 'errors': item_errors})
+        else:
+          valid.append((index, values))
+      if valid:
+        created += save_questions(valid, errors)
+
+    question_counts.clear()
+    return jsonify({
+      'success': True,
+      'created': created,
+      'failed': len(errors),
+      'errors': sorted(errors, key=lambda error: error['index']),
+      'total_questions': count_questions('all', Question.query)
+    })
+
+  '''
+  Streams every question as NDJSON, one question per line, 
+  reading them from the database in batches as the response 
+  is written. ?category= limits it to one category.
+  '''
+  @app.route('/questions/export', methods=['GET'])
+  def export_trivia_questions():
+    query = Question.query
+    category = request.args.get('category', None, type=int)
+    if(category is not None):
+      query = query.filter(Question.category == category)
+    columns = [Question.id, Question.question, Question.answer,
+      Question.category, Question.difficulty]
+    response = Response(
+      stream_with_context(export_ndjson(query, columns, Question.id)),
+      mimetype=NDJSON)
+    response.headers['Content-Disposition'] = 'attachment; filename=questions.ndjson'
+    return response
+
   '''
   A POST endpoint to get questions based on a search term. 
-  It will return any questions for whom the search term 
-  is a substring of the question. 
+  It will return any questions whose question or answer 
+  has every word of the search term, best match first. 
 
   Search by any phrase. The questions list will update to include 
-  only question that include that string within their question. 
+  only question that match it. The last word may be partly typed. 
   '''
 
   @app.route('/questions/search', methods=['POST'])
   def search_questions():
     body = get_body(request)
 
-    search_term = body.get('searchTerm')
-    questions = Question.query.filter(Question.question.ilike('%'+search_term+'%')).all()
-    paginated_questions = paginate_items(questions, 1)
+    search_term = body.get('searchTerm', None) or ''
+    query = question_search.search(search_term)
+    paginated_questions = paginate_questions(query, ranked=True)
     
     if(len(paginated_questions) == 0):
       abort(404)
@@ -149,7 +316,7 @@ def create_app(test_config=None):
     return jsonify({
       'success': True,
       'questions': paginated_questions,
-      'total_questions': len(questions),
+      'total_questions': query.count(),
       'current_category': paginated_questions[0]['category']
     })
 
@@ -162,16 +329,15 @@ def create_app(test_config=None):
   '''
   @app.route('/categories/<int:category_id>/questions', methods=['GET'])
   def get_questions_for_category(category_id):
-    questions = Question.query.filter(Question.category == category_id).all()
-    if(questions is None or len(questions) == 0):
+    query = Question.query.filter(Question.category == category_id)
+    paginated_questions = paginate_questions(query)
+    if(len(paginated_questions) == 0):
       abort(404)
 
-    paginated_questions = paginate_items(questions, 1)
-
     return jsonify({
       'success': True,
       'questions':paginated_questions,
-      'total_questions':len(paginated_questions),
+      'total_questions':count_questions(('category', category_id), query),
       'current_category':paginated_questions[0]['category']
     })
 
@@ -184,22 +350,67 @@ def create_app(test_config=None):
   The "Play" tab, after a user selects "All" or a category,
   one question at a time is displayed, the user is allowed to answer
   and shown whether they were correct or not. 
+
+  The first request of a quiz starts a session: the questions of 
+  the category, less any previous questions, are shuffled into 
+  quiz_sessions and the response carries its session_id. Passing 
+  that session_id back returns the next question of the session, 
+  so previous_questions no longer needs to be sent. question is 
+  null once every question has been asked.
   '''
   @app.route("/quizzes", methods=['POST'])
   def get_quizzes():
     body = get_body(request)
 
-    previous_questions = body.get('previous_questions', None)
-    quiz_category = body.get('quiz_category', None)
-    query = Question.query
-    if(quiz_category is not None and quiz_category['id'] is not 0):
-      query = query.filter(Question.category == quiz_category['id'])
-    questions = query.filter(Question.id.notin_(previous_questions)).all()
-    random_question = random.choice(questions)
+    session_id = body.get('session_id', None)
+    if(session_id is None):
+      previous_questions = body.get('previous_questions', None) or []
+      quiz_category = body.get('quiz_category', None)
+      category = None
+      if(quiz_category is not None):
+        if(not isinstance(quiz_category, dict)):
+          abort(400)
+        category = get_category_id(quiz_category.get('id', 0))
+        if(category is None):
+          abort(400)
+        if(category == 0):
+          category = None
+      session_id = quiz_sessions.create(
+        quiz_sampler.shuffled(category, previous_questions))
+
+    next_question = None
+    while next_question is None:
+      try:
+        question_id = quiz_sessions.pop(str(session_id))
+      except KeyError:
+        abort(404)
+      if(question_id is None):
+        break
+      # skips questions deleted since the session started.
+      next_question = Question.query.get(question_id)
 
     return jsonify({
       'success': True,
-      'question': random_question.format()
+      'session_id': session_id,
+      'question': next_question.format() if next_question else None
+    })
+
+  '''
+  An endpoint to GET the checkout waits of the connection pool, 
+  to size DB_POOL_SIZE for the number of workers. 
+  It is only served in debug mode, or with POOL_STATS_ENDPOINT 
+  set, and is a 404 for SQLite, which has no pool to measure.
+  '''
+  @app.route('/debug/pool', methods=['GET'])
+  def get_debug_pool():
+    if(not app.config.get('POOL_STATS_ENDPOINT', app.debug)):
+      abort(404)
+    stats = get_pool_stats(db.get_engine(app))
+    if(stats is None):
+      abort(404)
+    return jsonify({
+      'success': True,
+      'pool': stats
     })
 
   @app.errorhandler(400)
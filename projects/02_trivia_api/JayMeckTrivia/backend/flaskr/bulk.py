@@ -0,0 +1,95 @@
+import json
+from itertools import islice
+
+BULK_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+NDJSON = 'application/x-ndjson'
+
+'''
+Yields (index, item) for each question sent to POST /questions/bulk,
+either as a JSON array or as NDJSON, one object per line. NDJSON is
+read from the request stream a line at a time. A line that isn't
+valid JSON is yielded as a None item. Raises ValueError if the body
+is neither.
+'''
+def read_items(request):
+  if request.mimetype == NDJSON:
+    return read_ndjson(request.stream)
+  items = request.get_json(silent=True)
+  if not isinstance(items, list):
+    raise ValueError('Expected a JSON array or NDJSON')
+  return enumerate(items)
+
+def read_ndjson(stream):
+  index = 0
+  for line in stream:
+    if not line.strip():
+      continue
+    try:
+      item = json.loads(line)
+    except ValueError:
+      item = None
+    yield index, item
+    index += 1
+
+'''
+Checks one item against the fields a question needs.
+category_ids holds the ids of every category.
+Returns (question values, None), or (None, a list of errors).
+'''
+def validate_question(item, category_ids):
+  if not isinstance(item, dict):
+    return None, ['Not a JSON object']
+
+  errors = []
+  for field in ('question', 'answer'):
+    value = item.get(field)
+    if not isinstance(value, str) or not value.strip():
+      errors.append('{} is required'.format(field))
+
+  difficulty = item.get('difficulty')
+  if not isinstance(difficulty, int) or isinstance(difficulty, bool):
+    errors.append('difficulty must be an integer')
+
+  try:
+    category = int(item.get('category'))
+  except (TypeError, ValueError):
+    category = None
+  if category not in category_ids:
+    errors.append('category must be the id of a category')
+
+  if errors:
+    return None, errors
+  return {
+    'question': item['question'],
+    'answer': item['answer'],
+    'category': category,
+    'difficulty': difficulty
+  }, None
+
+def batched(iterable, size):
+  iterator = iter(iterable)
+  batch = list(islice(iterator, size))
+  while batch:
+    yield batch
+    batch = list(islice(iterator, size))
+
+'''
+Yields every question in query as a line of NDJSON, reading
+batch_size questions at a time in id order so the whole bank
+is never held in memory. columns are the Question columns to
+export, in the order of the keys of each line.
+'''
+def export_ndjson(query, columns, id_column, batch_size=EXPORT_BATCH_SIZE):
+  names = [column.key for column in columns]
+  last_id = None
+  while True:
+    page = query.with_entities(*columns).order_by(id_column)
+    if last_id is not None:
+      page = page.filter(id_column > last_id)
+    rows = page.limit(batch_size).all()
+    for row in rows:
+      yield json.dumps(dict(zip(names, row))) + '\n'
+    if len(rows) < batch_size:
+      return
+    last_id = rows[-1][names.index(id_column.key)]
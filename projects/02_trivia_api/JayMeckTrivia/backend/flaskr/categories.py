@@ -0,0 +1,118 @@
+import hashlib
+import json
+import time
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# How long the loaded categories are trusted. Writes in this process
+# invalidate them at once, this covers writes from other processes.
+CATEGORY_RELOAD_SECONDS = 300
+
+'''
+CategoryRegistry
+    Holds the {id: type} map of every category of one app, loaded
+    once and shared by every request of this process. Each load gets
+    a new version. Once registered, a commit that inserts, updates
+    or deletes a model_class row through the app's session
+    invalidates it, and refresh() reloads it at once for changes
+    made outside the app.
+
+    model_class: the Category model, it must have id and type.
+'''
+class CategoryRegistry:
+  def __init__(self, model_class, reload_seconds=CATEGORY_RELOAD_SECONDS):
+    self.model_class = model_class
+    self.reload_seconds = reload_seconds
+    self.lock = Lock()
+    self.version = 0
+    self.loaded_version = None
+    self.loaded_at = None
+    self.categories = {}
+    self.etag = None
+
+  '''
+  Returns the {id: type} map of every category.
+  '''
+  def get(self):
+    return self.load()[0]
+
+  '''
+  Returns the {id: type} map of every category and its ETag, from 
+  the same load. The ETag is a digest of their content, so every 
+  process serving the same categories gives the same ETag.
+  '''
+  def load(self):
+    with self.lock:
+      stale = self.loaded_at is None or \
+        time.monotonic() - self.loaded_at > self.reload_seconds
+      if stale or self.loaded_version != self.version:
+        self.reload()
+      return self.categories, self.etag
+
+  '''
+  Reloads the categories now.
+  '''
+  def refresh(self):
+    with self.lock:
+      self.version += 1
+      self.reload()
+
+  '''
+  Marks the categories stale so the next request reloads them.
+  '''
+  def invalidate(self):
+    with self.lock:
+      self.version += 1
+
+  def reload(self):
+    rows = self.model_class.query.with_entities(
+      self.model_class.id, self.model_class.type).order_by(self.model_class.id).all()
+    self.categories = {row.id: row.type for row in rows}
+    content = json.dumps(sorted(self.categories.items())).encode('utf-8')
+    self.etag = hashlib.sha1(content).hexdigest()
+    self.loaded_version = self.version
+    self.loaded_at = time.monotonic()
+
+'''
+The registry of each app. One set of session listeners serves them
+all: a flush that writes a category of the session's app marks the
+session, and its commit invalidates that app's registry. Invalidating
+only after the commit means a request can't reload the old rows
+between the write and the commit and keep them as current.
+'''
+registries = WeakKeyDictionary()
+
+'''
+Makes registry the one invalidated by writes through the session 
+of app.
+'''
+def register(app, registry):
+  registries[app] = registry
+
+def get_session_registry(session):
+  app = getattr(session, 'app', None)
+  return registries.get(app) if app is not None else None
+
+@event.listens_for(Session, 'after_flush')
+def on_flush(session, flush_context):
+  registry = get_session_registry(session)
+  if registry is None:
+    return
+  for instance in (session.new | session.dirty | session.deleted):
+    if isinstance(instance, registry.model_class):
+      session.info['categories_changed'] = True
+      return
+
+@event.listens_for(Session, 'after_commit')
+def on_commit(session):
+  if session.info.pop('categories_changed', False):
+    registry = get_session_registry(session)
+    if registry is not None:
+      registry.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def on_rollback(session):
+  session.info.pop('categories_changed', None)
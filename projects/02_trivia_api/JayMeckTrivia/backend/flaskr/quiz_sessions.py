@@ -0,0 +1,153 @@
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+QUIZ_SESSION_LIMIT = 10000
+# Sessions not used for this long are dropped by the SQLite store.
+QUIZ_SESSION_SECONDS = 24 * 60 * 60
+
+def new_session_id():
+  return uuid.uuid4().hex
+
+'''
+MemorySessionStore
+    Keeps the remaining question ids of each quiz session in this
+    process. Once limit sessions are held the least recently used
+    one is dropped. Sessions don't survive a restart and aren't
+    shared between processes.
+'''
+class MemorySessionStore:
+  def __init__(self, limit=QUIZ_SESSION_LIMIT):
+    self.limit = limit
+    self.lock = Lock()
+    self.sessions = OrderedDict()
+
+  '''
+  Stores question_ids, already shuffled, as a new session
+  and returns its id.
+  '''
+  def create(self, question_ids):
+    session_id = new_session_id()
+    # reversed so the next id is popped off the end.
+    remaining = list(reversed(question_ids))
+    with self.lock:
+      self.sessions[session_id] = remaining
+      while len(self.sessions) > self.limit:
+        self.sessions.popitem(last=False)
+    return session_id
+
+  '''
+  Returns the next question id of the session, None when it has
+  none left. Raises KeyError if there is no such session.
+  '''
+  def pop(self, session_id):
+    with self.lock:
+      remaining = self.sessions[session_id]
+      self.sessions.move_to_end(session_id)
+      return remaining.pop() if remaining else None
+
+  def delete(self, session_id):
+    with self.lock:
+      self.sessions.pop(session_id, None)
+
+'''
+SQLiteSessionStore
+    Keeps quiz sessions in a SQLite file, so they are shared by
+    every process on the host and survive a restart. Each question
+    of a session is a row keyed by (session, position), so popping
+    the next one is a primary key lookup however long the quiz is.
+'''
+class SQLiteSessionStore:
+  def __init__(self, path, max_age=QUIZ_SESSION_SECONDS):
+    self.path = path
+    self.max_age = max_age
+    with self.connect() as connection:
+      connection.executescript('''
+        CREATE TABLE IF NOT EXISTS quiz_sessions (
+          id TEXT PRIMARY KEY,
+          position INTEGER NOT NULL,
+          used_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_quiz_sessions_used_at
+          ON quiz_sessions (used_at);
+        CREATE TABLE IF NOT EXISTS quiz_session_questions (
+          session_id TEXT NOT NULL,
+          position INTEGER NOT NULL,
+          question_id INTEGER NOT NULL,
+          PRIMARY KEY (session_id, position)
+        ) WITHOUT ROWID;
+      ''')
+
+  '''
+  Opens a connection for one transaction, committed when the block
+  ends. A connection per call lets threads share the store.
+  '''
+  @contextmanager
+  def connect(self):
+    connection = sqlite3.connect(self.path, timeout=10)
+    try:
+      with connection:
+        yield connection
+    finally:
+      connection.close()
+
+  def create(self, question_ids):
+    session_id = new_session_id()
+    now = time.time()
+    with self.connect() as connection:
+      self.delete_expired(connection, now)
+      connection.execute(
+        'INSERT INTO quiz_sessions (id, position, used_at) VALUES (?, 0, ?)',
+        (session_id, now))
+      connection.executemany(
+        'INSERT INTO quiz_session_questions (session_id, position, question_id) '
+        'VALUES (?, ?, ?)',
+        ((session_id, position, question_id)
+          for position, question_id in enumerate(question_ids)))
+    return session_id
+
+  def pop(self, session_id):
+    with self.connect() as connection:
+      connection.execute('BEGIN IMMEDIATE')
+      row = connection.execute(
+        'SELECT position FROM quiz_sessions WHERE id = ?', (session_id,)).fetchone()
+      if row is None:
+        raise KeyError(session_id)
+      position = row[0]
+      question = connection.execute(
+        'SELECT question_id FROM quiz_session_questions '
+        'WHERE session_id = ? AND position = ?', (session_id, position)).fetchone()
+      connection.execute(
+        'UPDATE quiz_sessions SET position = ?, used_at = ? WHERE id = ?',
+        (position + 1 if question else position, time.time(), session_id))
+      return question[0] if question else None
+
+  def delete(self, session_id):
+    with self.connect() as connection:
+      self.delete_sessions(connection, [session_id])
+
+  def delete_expired(self, connection, now):
+    expired = [row[0] for row in connection.execute(
+      'SELECT id FROM quiz_sessions WHERE used_at < ?', (now - self.max_age,))]
+    self.delete_sessions(connection, expired)
+
+  def delete_sessions(self, connection, session_ids):
+    connection.executemany(
+      'DELETE FROM quiz_session_questions WHERE session_id = ?',
+      ((session_id,) for session_id in session_ids))
+    connection.executemany(
+      'DELETE FROM quiz_sessions WHERE id = ?',
+      ((session_id,) for session_id in session_ids))
+
+'''
+Returns the store named by the app config: a SQLiteSessionStore
+on QUIZ_SESSION_DB when it is set, otherwise a MemorySessionStore.
+'''
+def get_session_store(config):
+  path = config.get('QUIZ_SESSION_DB')
+  if path:
+    return SQLiteSessionStore(path)
+  return MemorySessionStore(config.get('QUIZ_SESSION_LIMIT', QUIZ_SESSION_LIMIT))
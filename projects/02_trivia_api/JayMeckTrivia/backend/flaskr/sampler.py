@@ -0,0 +1,86 @@
+import random
+import time
+from threading import Lock
+
+'''
+QuestionSampler
+    Keeps the ids of every question, grouped by category, in memory
+    so a quiz question can be picked without reading the questions
+    table. The ids are loaded on first use, kept current by add()
+    and remove() as this process writes questions, and reloaded
+    every reload_seconds to pick up writes from other processes.
+
+    load_ids: returns (id, category) for every question, category
+      being the integer id of its category.
+'''
+class QuestionSampler:
+  def __init__(self, load_ids, reload_seconds=300):
+    self.load_ids = load_ids
+    self.reload_seconds = reload_seconds
+    self.lock = Lock()
+    self.loaded_at = None
+    # category -> list of ids, None holds every id. positions maps
+    # (category, id) to its index so ids are removed in O(1).
+    self.ids = {}
+    self.positions = {}
+
+  '''
+  Returns every question id in category (every category if None)
+  that isn't in exclude, in a random order.
+  '''
+  def shuffled(self, category=None, exclude=()):
+    with self.lock:
+      self.reload_if_stale()
+      excluded = set(exclude)
+      ids = [question_id for question_id in self.ids.get(category, [])
+        if question_id not in excluded]
+    random.shuffle(ids)
+    return ids
+
+  def add(self, question_id, category):
+    with self.lock:
+      if self.loaded_at is not None:
+        self.add_id(question_id, category)
+
+  def remove(self, question_id, category):
+    with self.lock:
+      if self.loaded_at is not None:
+        self.remove_id(question_id, category)
+
+  '''
+  drops every id so they are loaded again on next use.
+  '''
+  def invalidate(self):
+    with self.lock:
+      self.loaded_at = None
+
+  def reload_if_stale(self):
+    if self.loaded_at is None or time.monotonic() - self.loaded_at > self.reload_seconds:
+      self.reload()
+
+  def reload(self):
+    self.ids = {None: []}
+    self.positions = {}
+    for question_id, category in self.load_ids():
+      self.add_id(question_id, category)
+    self.loaded_at = time.monotonic()
+
+  def add_id(self, question_id, category):
+    for key in (None, category):
+      if (key, question_id) in self.positions:
+        continue
+      ids = self.ids.setdefault(key, [])
+      self.positions[(key, question_id)] = len(ids)
+      ids.append(question_id)
+
+  def remove_id(self, question_id, category):
+    for key in (None, category):
+      index = self.positions.pop((key, question_id), None)
+      if index is None:
+        continue
+      # move the last id into the removed id's slot.
+      ids = self.ids[key]
+      last = ids.pop()
+      if index < len(ids):
+        ids[index] = last
+        self.positions[(key, last)] = index
@@ -0,0 +1,90 @@
+import re
+from sqlalchemy import DDL, event, func, literal_column, or_, text
+from sqlalchemy.sql import column, table
+
+SEARCH_TABLE = 'questions_search'
+# The text that is searched. Postgres only uses the index when a
+# query repeats the indexed expression exactly.
+SEARCH_VECTOR = "to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, ''))"
+
+'''
+QuestionSearch
+    Ranked full text search over the question and answer of every
+    question. On Postgres a GIN index covers their tsvector. On
+    SQLite (local and test runs) triggers mirror them into an FTS5
+    table. Any other database falls back to ILIKE.
+
+    The index is created with the questions table. trivia.psql
+    creates the same index for a database loaded from it.
+'''
+class QuestionSearch:
+  def __init__(self, db, model):
+    self.db = db
+    self.model = model
+    self.fts = table(SEARCH_TABLE, column('rowid'), column('rank'))
+    questions = model.__table__
+    for statement in get_search_ddl(questions.name):
+      event.listen(questions, 'after_create', statement)
+    event.listen(questions, 'before_drop',
+      DDL('DROP TABLE IF EXISTS {0}'.format(SEARCH_TABLE)).execute_if(dialect='sqlite'))
+
+  '''
+  Returns a query of the questions matching every word of term,
+  best match first. The last word may be partly typed. An empty
+  term matches every question.
+  '''
+  def search(self, term):
+    words = re.findall(r'\w+', term.lower())
+    dialect = self.db.session.get_bind().dialect.name
+    if words and dialect == 'postgresql':
+      return self.search_postgres(words)
+    if words and dialect == 'sqlite':
+      return self.search_sqlite(words)
+    return self.search_ilike(term)
+
+  def search_postgres(self, words):
+    vector = literal_column(SEARCH_VECTOR)
+    query = text("to_tsquery('english', :search_query)").bindparams(
+      search_query=' & '.join(word + ':*' for word in words))
+    return self.model.query.filter(vector.op('@@')(query)
+      ).order_by(func.ts_rank(vector, query).desc(), self.model.id)
+
+  def search_sqlite(self, words):
+    match = text('{0} MATCH :search_query'.format(SEARCH_TABLE)).bindparams(
+      search_query=' '.join('"{0}"*'.format(word) for word in words))
+    return self.model.query.join(self.fts, self.fts.c.rowid == self.model.id
+      ).filter(match).order_by(self.fts.c.rank, self.model.id)
+
+  def search_ilike(self, term):
+    look_for = '%{0}%'.format(term)
+    return self.model.query.filter(or_(
+      self.model.question.ilike(look_for), self.model.answer.ilike(look_for))
+      ).order_by(self.model.id)
+
+'''
+The index DDL for each database, run after the questions table
+is created.
+'''
+def get_search_ddl(table_name):
+  postgres = [
+    'CREATE INDEX ix_{0}_search ON {0} USING gin ({1})'.format(table_name, SEARCH_VECTOR)
+  ]
+  sqlite = [
+    'CREATE VIRTUAL TABLE {1} USING fts5(question, answer, '
+    "content='{0}', content_rowid='id', tokenize='porter unicode61')",
+    'CREATE TRIGGER {1}_ai AFTER INSERT ON {0} BEGIN '
+    'INSERT INTO {1}(rowid, question, answer) VALUES (new.id, new.question, new.answer); '
+    'END',
+    'CREATE TRIGGER {1}_ad AFTER DELETE ON {0} BEGIN '
+    'INSERT INTO {1}({1}, rowid, question, answer) '
+    "VALUES ('delete', old.id, old.question, old.answer); "
+    'END',
+    'CREATE TRIGGER {1}_au AFTER UPDATE ON {0} BEGIN '
+    'INSERT INTO {1}({1}, rowid, question, answer) '
+    "VALUES ('delete', old.id, old.question, old.answer); "
+    'INSERT INTO {1}(rowid, question, answer) VALUES (new.id, new.question, new.answer); '
+    'END'
+  ]
+  return [DDL(statement).execute_if(dialect='postgresql') for statement in postgres] + \
+    [DDL(statement.format(table_name, SEARCH_TABLE)).execute_if(dialect='sqlite')
+      for statement in sqlite]
@@ -1,25 +1,81 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from query_stats import QueryStats
+from pool_stats import TimedQueuePool
+
 database_name = "trivia"
 database_path = "postgres://{}:{}@{}/{}".format(
     'postgres', 'Blue84paired.', 'localhost:5432', database_name)
 
 db = SQLAlchemy()
 
+'''
+query_stats
+    counts the statements each request runs, see query_stats.py
+'''
+query_stats = QueryStats()
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    engine_options are passed to create_engine, by default those
+    of get_engine_options, see pool_stats.py for the checkout waits
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, engine_options=None):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if engine_options is None:
+        engine_options = get_engine_options(app.config, database_path)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
     db.app = app
     db.init_app(app)
+    query_stats.init_app(app, db)
     db.create_all()
 
+'''
+get_engine_options(config, database_path)
+    returns the create_engine options for database_path, none for
+    SQLite. Each setting is read from config, such as the test_config
+    of create_app, or else from the environment variable of that name
+
+    DB_POOL_SIZE            5     connections kept open
+    DB_MAX_OVERFLOW         10    extra connections opened under load
+    DB_POOL_TIMEOUT         30    seconds to wait for a connection
+    DB_POOL_RECYCLE         1800  seconds before a connection is replaced
+    DB_POOL_PRE_PING        true  test each connection before it is used
+    DB_STATEMENT_TIMEOUT    0     Postgres statement timeout in ms, 0 for none
+    DB_POOL_SLOW_CHECKOUT   0.1   seconds a checkout may wait before it is logged
+'''
+def get_engine_options(config, database_path=database_path):
+    if database_path.startswith('sqlite'):
+        return {}
+
+    def get_setting(key, default, parse=int):
+        value = config.get(key, os.environ.get(key))
+        return default if value in (None, '') else parse(value)
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': get_setting('DB_POOL_SIZE', 5),
+        'max_overflow': get_setting('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': get_setting('DB_POOL_TIMEOUT', 30, float),
+        'pool_recycle': get_setting('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': get_setting('DB_POOL_PRE_PING', True, parse_bool),
+        'slow_checkout': get_setting('DB_POOL_SLOW_CHECKOUT', 0.1, float)
+    }
+    statement_timeout = get_setting('DB_STATEMENT_TIMEOUT', 0)
+    if statement_timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={:d}'.format(statement_timeout)
+        }
+    return options
+
+def parse_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
 '''
 Question
 
@@ -30,7 +86,8 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id',
+    onupdate='CASCADE', ondelete='SET NULL'), index=True)
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -0,0 +1,95 @@
+#----------------------------------------------------------------------------#
+# Pool Stats.
+#----------------------------------------------------------------------------#
+
+import logging
+from threading import Lock
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+'''
+TimedQueuePool
+    A QueuePool that times how long each checkout waits for a
+    connection, either for one to be returned or for a new one to be
+    opened. Checkouts waiting longer than slow_checkout seconds, and
+    the ones that time out, are logged with the pool status, so a pool
+    too small for the number of workers shows up in the logs.
+
+    slow_checkout can be passed to create_engine with the pool
+    options, as get_engine_options does.
+'''
+class TimedQueuePool(QueuePool):
+  def __init__(self, creator, slow_checkout=0.1, **kwargs):
+    super().__init__(creator, **kwargs)
+    self.slow_checkout = slow_checkout
+    self.lock = Lock()
+    self.reset_stats()
+
+  def reset_stats(self):
+    with self.lock:
+      self.checkouts = 0
+      self.slow_checkouts = 0
+      self.timeouts = 0
+      self.wait_seconds = 0.0
+      self.max_wait_seconds = 0.0
+
+  def _do_get(self):
+    start = time.perf_counter()
+    try:
+      connection = super()._do_get()
+    except exc.TimeoutError:
+      self.add_wait(time.perf_counter() - start, timed_out=True)
+      logger.warning('Timed out waiting for a database connection: %s', self.status())
+      raise
+    seconds = time.perf_counter() - start
+    if self.add_wait(seconds):
+      logger.warning('Waited %.1f ms for a database connection: %s', seconds * 1000, self.status())
+    return connection
+
+  '''
+    counts a checkout that waited seconds, and returns whether
+    it was slow.
+  '''
+  def add_wait(self, seconds, timed_out=False):
+    slow = not timed_out and seconds > self.slow_checkout
+    with self.lock:
+      self.checkouts += 1
+      self.wait_seconds += seconds
+      self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+      self.timeouts += timed_out
+      self.slow_checkouts += slow
+    return slow
+
+  def recreate(self):
+    pool = super().recreate()
+    pool.slow_checkout = self.slow_checkout
+    return pool
+
+'''
+  returns the checkout waits of the pool of engine, in ms, with its
+  size and the connections in use, or None if it isn't a
+  TimedQueuePool, as for SQLite.
+'''
+def get_pool_stats(engine):
+  pool = engine.pool
+  if not isinstance(pool, TimedQueuePool):
+    return None
+  with pool.lock:
+    checkouts = pool.checkouts
+    stats = {
+      'checkouts': checkouts,
+      'slow_checkouts': pool.slow_checkouts,
+      'timeouts': pool.timeouts,
+      'wait_ms_mean': round(pool.wait_seconds * 1000 / checkouts, 3) if checkouts else 0.0,
+      'wait_ms_max': round(pool.max_wait_seconds * 1000, 1)
+    }
+  stats.update({
+    'size': pool.size(),
+    'checked_out': pool.checkedout(),
+    'overflow': pool.overflow()
+  })
+  return stats
@@ -1,10 +1,16 @@
 import os
+import re
+import shutil
+import tempfile
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text, create_engine
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import db, Question, Category, query_stats, get_engine_options
+from pool_stats import TimedQueuePool, get_pool_stats
+
+PSQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')
 
 def check_basic_success(self, url, http_method):
     return basic_check(self, url, http_method, self.assertTrue)
@@ -19,24 +25,44 @@ def basic_check(self, url, http_method, assert_method, code=200):
     self.assertEqual(res.status_code, code)
     return data
 
+def load_psql(path):
+    '''Inserts the rows of the COPY blocks of a pg_dump file, so a
+    database other than Postgres starts with the same questions.'''
+    with open(path) as dump:
+        lines = iter(dump.read().splitlines())
+    for line in lines:
+        copy = re.match(r'COPY public\.(\w+) \((.*)\) FROM stdin;', line)
+        if copy is None:
+            continue
+        table, columns = copy.group(1), copy.group(2).split(', ')
+        insert = text('INSERT INTO {} ({}) VALUES ({})'.format(
+            table, ', '.join(columns), ', '.join(':' + column for column in columns)))
+        for row in lines:
+            if row == '\\.':
+                break
+            values = [None if value == '\\N' else value for value in row.split('\t')]
+            db.session.execute(insert, dict(zip(columns, values)))
+    db.session.commit()
+
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}:{}@{}/{}".format(
-            'postgres', 'Blue84paired.', 'localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        """Define test variables and initialize app.
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        Each test gets a new SQLite database loaded from trivia.psql,
+        unless TRIVIA_TEST_DATABASE names a database to use instead."""
+        self.database_dir = None
+        self.database_path = os.environ.get('TRIVIA_TEST_DATABASE')
+        if self.database_path is None:
+            self.database_dir = tempfile.mkdtemp()
+            self.database_path = 'sqlite:///' + os.path.join(self.database_dir, 'trivia_test.db')
+
+        self.app = create_app({'DATABASE_PATH': self.database_path})
+        self.client = self.app.test_client
+        if self.database_dir is not None:
+            with self.app.app_context():
+                load_psql(PSQL_PATH)
 
         self.new_question = {
             'question': 'new_question',
@@ -47,23 +73,126 @@ class TriviaTestCase(unittest.TestCase):
     
     def tearDown(self):
         """Executed after each test"""
-        pass
+        with self.app.app_context():
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+        if self.database_dir is not None:
+            shutil.rmtree(self.database_dir)
 
     def test_GET_trivia_questions(self):
         data = check_basic_success(self, '/questions', self.client().get)
         self.assertTrue(data['questions'])
         self.assertTrue(len(data['questions']) <= 10)
 
+    def test_GET_trivia_questions_per_page(self):
+        data = check_basic_success(self, '/questions?per_page=3', self.client().get)
+        self.assertEqual(len(data['questions']), 3)
+        self.assertTrue(data['total_questions'] > 3)
+
+    def test_GET_trivia_questions_after(self):
+        first_page = check_basic_success(self, '/questions?per_page=2', self.client().get)
+        last_id = first_page['questions'][-1]['id']
+        data = check_basic_success(self, '/questions?per_page=2&after={}'.format(last_id), self.client().get)
+        self.assertTrue(all(question['id'] > last_id for question in data['questions']))
+
     def test_GET_categories(self):
         data = check_basic_success(self, '/categories',self.client().get)
         self.assertTrue(data['categories'])
     
+    def test_GET_categories_not_modified(self):
+        res = self.client().get('/categories')
+        self.assertIsNotNone(res.headers.get('ETag'))
+        res = self.client().get('/categories', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+
+    def test_GET_trivia_questions_query_budget(self):
+        self.client().get('/questions')
+        with query_stats.expect(1):
+            check_basic_success(self, '/questions?page=2', self.client().get)
+
+    def test_GET_categories_after_commit(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        with self.app.app_context():
+            db.session.add(Category('Music'))
+            db.session.flush()
+            self.assertNotIn('Music', self.app.extensions['categories'].get().values())
+            db.session.commit()
+        res = self.client().get('/categories')
+        self.assertIn('Music', res.get_json()['categories'].values())
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_categories_registry_per_app(self):
+        other_app = create_app({'DATABASE_PATH': self.database_path})
+        registry = self.app.extensions['categories']
+        self.assertIsNot(other_app.extensions['categories'], registry)
+        version = registry.version
+        with other_app.app_context():
+            db.session.add(Category('Music'))
+            db.session.commit()
+            db.session.remove()
+        self.assertEqual(registry.version, version)
+        self.assertNotEqual(other_app.extensions['categories'].version, 0)
+
+    def test_GET_categories_query_budget(self):
+        self.client().get('/categories')
+        with query_stats.expect(0):
+            check_basic_success(self, '/categories', self.client().get)
+
+    def test_GET_questions_by_category_query_budget(self):
+        with query_stats.expect(2):
+            check_basic_success(self, 'categories/1/questions', self.client().get)
+
+    def test_query_budget_exceeded(self):
+        with self.assertRaises(AssertionError):
+            with query_stats.expect(0):
+                self.client().get('/questions')
+
+    def test_query_stats_repeated(self):
+        with self.app.app_context():
+            with query_stats.expect(10) as queries:
+                for question_id in range(1, 11):
+                    Question.query.get(question_id)
+        self.assertEqual(queries.count, 10)
+        self.assertEqual([times for statement, times in queries.repeated()], [10])
+
+    def test_query_stats_headers(self):
+        self.app.config['QUERY_STATS_HEADERS'] = True
+        res = self.client().get('/questions')
+        self.assertTrue(int(res.headers['X-Query-Count']) > 0)
+        self.assertEqual(res.headers['X-Query-Repeated'], '0')
+        self.assertIn('X-Query-Time', res.headers)
+
+    def test_engine_options_from_config(self):
+        config = {'DB_POOL_SIZE': '3', 'DB_STATEMENT_TIMEOUT': '5000'}
+        options = get_engine_options(config, 'postgres://postgres@localhost:5432/trivia')
+        self.assertEqual(options['pool_size'], 3)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(get_engine_options(config, 'sqlite:///trivia_test.db'), {})
+
+    def test_pool_stats(self):
+        engine = create_engine(self.database_path, poolclass=TimedQueuePool,
+            pool_size=2, slow_checkout=60)
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            stats = get_pool_stats(engine)
+        engine.dispose()
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertEqual(stats['slow_checkouts'], 0)
+        self.assertEqual(stats['checked_out'], 1)
+        self.assertEqual(stats['size'], 2)
+        self.assertIsNone(get_pool_stats(db.get_engine(self.app)))
+
+    def test_GET_debug_pool_fail(self):
+        check_basic_failure(self, '/debug/pool', 404, self.client().get)
+
     def test_GET_trivia_questions_fail(self):
         data = check_basic_failure(self, '/questions?page=1000', 404, self.client().get)
 
     def test_DELETE_trivia_question_success(self):
-        # If testing this multiple times, change the id it deletes.
-        data = check_basic_success(self, '/questions/1', self.client().delete)
+        data = check_basic_success(self, '/questions/2', self.client().delete)
         self.assertTrue(data['deleted'])
         self.assertTrue(data['total_questions'])
 
@@ -75,16 +204,65 @@ class TriviaTestCase(unittest.TestCase):
         data = json.loads(res.data)
         self.assertTrue(data['success'])
         self.assertTrue(data['created'])
+        self.assertEqual(data['question']['id'], data['created'])
+        self.assertEqual(data['question']['answer'], self.new_question['answer'])
+
+    def test_POST_trivia_questions_total(self):
+        before = check_basic_success(self, '/questions', self.client().get)
+        res = self.client().post('/questions', json=self.new_question)
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], before['total_questions'] + 1)
+        res = self.client().delete('/questions/{}'.format(data['created']))
+        data = json.loads(res.data)
+        self.assertEqual(data['question']['question'], self.new_question['question'])
+        self.assertEqual(data['total_questions'], before['total_questions'])
 
     def test_POST_trivia_questions_fail(self):
         check_basic_failure(self, '/questions', 400, self.client().post)
 
+    def test_POST_trivia_questions_bulk(self):
+        questions = [self.new_question, dict(self.new_question, question=''), self.new_question]
+        res = self.client().post('/questions/bulk', json=questions)
+        data = json.loads(res.data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(data['errors'][0]['index'], 1)
+
+    def test_POST_trivia_questions_bulk_ndjson(self):
+        body = '\n'.join(json.dumps(question) for question in [self.new_question, self.new_question])
+        res = self.client().post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(data['failed'], 0)
+
+    def test_POST_trivia_questions_bulk_fail(self):
+        res = self.client().post('/questions/bulk', json={'question': 'not a list'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_GET_questions_export(self):
+        res = self.client().get('/questions/export')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        questions = [json.loads(line) for line in res.data.decode().splitlines()]
+        total = check_basic_success(self, '/questions', self.client().get)['total_questions']
+        self.assertEqual(len(questions), total)
+
     def test_POST_search_question(self):
-        res = self.client().post('/questions/search', json={'searchTerm':'question'})
+        res = self.client().post('/questions/search', json={'searchTerm':'title'})
         data = json.loads(res.data)
         self.assertTrue(data['success'])
         self.assertTrue(data['questions'])
 
+    def test_POST_search_question_answer(self):
+        res = self.client().post('/questions/search', json={'searchTerm':'Fleming'})
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['answer'], 'Alexander Fleming')
+
+    def test_POST_search_question_prefix(self):
+        res = self.client().post('/questions/search', json={'searchTerm':'soccer wor'})
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 2)
+
     def test_GET_questions_by_category(self):
         data = check_basic_success(self, 'categories/1/questions', self.client().get)
         self.assertEqual(1, data['current_category'])
@@ -102,6 +280,51 @@ class TriviaTestCase(unittest.TestCase):
         data = json.loads(res.data)
         self.assertTrue(data['success'])
 
+    def test_POST_question_for_quiz_skips_previous(self):
+        category = check_basic_success(self, 'categories/1/questions?per_page=100', self.client().get)
+        question_ids = [question['id'] for question in category['questions']]
+        res = self.client().post('/quizzes', json={'previous_questions':question_ids[1:], 'quiz_category':{'id':1}})
+        data = json.loads(res.data)
+        self.assertEqual(data['question']['id'], question_ids[0])
+
+    def test_POST_question_for_quiz_category_id_string(self):
+        category = check_basic_success(self, 'categories/1/questions?per_page=100', self.client().get)
+        question_ids = [question['id'] for question in category['questions']]
+        res = self.client().post('/quizzes', json={'previous_questions':question_ids[1:], 'quiz_category':{'id':'1'}})
+        data = json.loads(res.data)
+        self.assertEqual(data['question']['id'], question_ids[0])
+
+    def test_POST_question_for_quiz_none_left(self):
+        category = check_basic_success(self, 'categories/1/questions?per_page=100', self.client().get)
+        question_ids = [question['id'] for question in category['questions']]
+        res = self.client().post('/quizzes', json={'previous_questions':question_ids, 'quiz_category':{'id':1}})
+        data = json.loads(res.data)
+        self.assertTrue(data['success'])
+        self.assertIsNone(data['question'])
+
+    def test_POST_question_for_quiz_session(self):
+        category = check_basic_success(self, 'categories/1/questions?per_page=100', self.client().get)
+        question_ids = [question['id'] for question in category['questions']]
+        res = self.client().post('/quizzes', json={'quiz_category':{'id':1}})
+        data = json.loads(res.data)
+        asked = [data['question']['id']]
+        for _ in question_ids:
+            res = self.client().post('/quizzes', json={'session_id':data['session_id']})
+            data = json.loads(res.data)
+            if data['question'] is not None:
+                asked.append(data['question']['id'])
+        self.assertEqual(sorted(asked), sorted(question_ids))
+        self.assertIsNone(data['question'])
+
+    def test_POST_question_for_quiz_category_fail(self):
+        for quiz_category in (1, [1], 'science'):
+            res = self.client().post('/quizzes', json={'previous_questions':[], 'quiz_category':quiz_category})
+            self.assertEqual(res.status_code, 400)
+
+    def test_POST_question_for_quiz_session_fail(self):
+        res = self.client().post('/quizzes', json={'session_id':'not-a-session'})
+        self.assertEqual(res.status_code, 404)
+
     def test_POST_question_for_quiz_fail(self):
         check_basic_failure(self,'/quizzes', 400, self.client().post)
 
@@ -10,6 +10,7 @@ class QuizView extends Component {
     super();
     this.state = {
         quizCategory: null,
+        quizSession: null,
         previousQuestions: [], 
         showAnswer: false,
         categories: {},
@@ -52,7 +53,9 @@ class QuizView extends Component {
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({
+      data: JSON.stringify(this.state.quizSession ? {
+        session_id: this.state.quizSession
+      } : {
         previous_questions: previousQuestions,
         quiz_category: this.state.quizCategory
       }),
@@ -63,6 +66,7 @@ class QuizView extends Component {
       success: (result) => {
         this.setState({
           showAnswer: false,
+          quizSession: result.session_id,
           previousQuestions: previousQuestions,
           currentQuestion: result.question,
           guess: '',
@@ -90,6 +94,7 @@ class QuizView extends Component {
   restartGame = () => {
     this.setState({
       quizCategory: null,
+      quizSession: null,
       previousQuestions: [], 
       showAnswer: false,
       numCorrect: 0,
@@ -0,0 +1,81 @@
+'''
+Benchmarks verify_decode_jwt() with and without the verified token
+cache, offline, against a key set held in memory.
+
+    python bench_auth.py [--repeat 2000]
+
+A new RSA key signs a token shaped like an Auth0 access token. The
+keys are cached by kid in both runs, so the difference is the cost
+of parsing the token and checking its signature.
+'''
+import argparse
+import base64
+import time
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+from src.auth import auth
+from src.auth.jwks import StaticJwksSource
+
+KID = 'bench'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    key = RSA.generate(2048)
+    auth.set_jwks_source(StaticJwksSource({'keys': [{
+        'kty': 'RSA',
+        'kid': KID,
+        'use': 'sig',
+        'n': encode_int(key.n),
+        'e': encode_int(key.e)
+    }]}))
+    token = get_token(key.export_key().decode('utf-8'))
+
+    def uncached():
+        auth.token_cache.clear()
+        auth.verify_decode_jwt(token)
+
+    def cached():
+        auth.verify_decode_jwt(token)
+
+    print('{0:<10}{1:>14}'.format('cache', 'us per token'))
+    without = time_call(uncached, args.repeat)
+    print('{0:<10}{1:>14.1f}'.format('off', without))
+    auth.token_cache.clear()
+    with_cache = time_call(cached, args.repeat)
+    print('{0:<10}{1:>14.1f}'.format('on', with_cache))
+    print('{0:.0f}x faster, {1}'.format(without / with_cache, auth.token_cache.stats()))
+
+def get_token(private_key):
+    now = int(time.time())
+    return jwt.encode({
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'sub': 'auth0|bench',
+        'iat': now,
+        'exp': now + 3600,
+        'permissions': ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+    }, private_key, algorithm='RS256', headers={'kid': KID})
+
+def encode_int(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+'''
+returns the mean microseconds of call, run repeat times after
+one untimed run.
+'''
+def time_call(call, repeat):
+    call()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - start) * 1000000 / repeat
+
+if __name__ == '__main__':
+    main()
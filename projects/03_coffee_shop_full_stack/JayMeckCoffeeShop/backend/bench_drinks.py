@@ -0,0 +1,102 @@
+'''
+Benchmarks serializing the whole menu with Drink.short() and
+Drink.long(), with the recipes decoded on every call as before and
+with the parsed recipes cached per drink.
+
+    python bench_drinks.py [--drinks 10000] [--repeat 5]
+
+The drinks are written to a throwaway SQLite file and read once, the
+way GET /drinks and GET /drinks-detail read them. Serializing them is
+timed apart from that query, which the cache doesn't change: decoded
+is the old way, first is a cold cache and cached a warm one.
+'''
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+
+from src.database import models
+from src.database.models import db, setup_db, Drink, recipe_cache
+
+INGREDIENTS = [('Water', 'blue'), ('Milk', 'white'), ('Espresso', 'brown'),
+    ('Foam', 'beige'), ('Chocolate', 'black'), ('Caramel', 'gold')]
+INSERT_BATCH = 5000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drinks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    models.database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_drinks.db')
+    app = Flask(__name__)
+    setup_db(app)
+    with app.app_context():
+        db.create_all()
+        seed_drinks(args.drinks)
+
+        query = time_call(lambda: Drink.query.all(), args.repeat)
+        drinks = Drink.query.all()
+        print('query of {0} drinks: {1:.1f} ms'.format(len(drinks), query))
+
+        print('{0:<8}{1:>16}{2:>16}{3:>16}'.format(
+            'form', 'decoded ms', 'first ms', 'cached ms'))
+        for form, decode in (('short', short_decoded), ('long', long_decoded)):
+            def cached():
+                return [getattr(drink, form)() for drink in drinks]
+
+            def first():
+                recipe_cache.clear()
+                return cached()
+
+            decoded = time_call(lambda: [decode(drink) for drink in drinks], args.repeat)
+            cold = time_call(first, args.repeat)
+            cached()
+            warm = time_call(cached, args.repeat)
+            print('{0:<8}{1:>16.1f}{2:>16.1f}{3:>16.1f}'.format(form, decoded, cold, warm))
+
+'''
+short() and long() as they were, decoding the recipe on each call
+'''
+def short_decoded(drink):
+    return {
+        'id': drink.id,
+        'title': drink.title,
+        'recipe': [{'color': r['color'], 'parts': r['parts']} for r in json.loads(drink.recipe)]
+    }
+
+def long_decoded(drink):
+    return {
+        'id': drink.id,
+        'title': drink.title,
+        'recipe': json.loads(drink.recipe)
+    }
+
+def seed_drinks(count):
+    rng = random.Random(count)
+    for start in range(0, count, INSERT_BATCH):
+        db.session.execute(Drink.__table__.insert(), [{
+            'title': 'Drink {0}'.format(number),
+            'recipe': json.dumps([{'name': name, 'color': color, 'parts': rng.randint(1, 3)}
+                for name, color in rng.sample(INGREDIENTS, 2)]),
+        } for number in range(start, min(start + INSERT_BATCH, count))])
+    db.session.commit()
+
+'''
+returns the mean milliseconds of call, run repeat times after
+one untimed run.
+'''
+def time_call(call, repeat):
+    call()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+if __name__ == '__main__':
+    main()
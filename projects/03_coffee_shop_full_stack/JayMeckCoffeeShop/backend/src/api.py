@@ -1,11 +1,15 @@
 import os
-from flask import Flask, request, jsonify, abort
+import logging
+from flask import Flask, request, jsonify, abort, Response
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_drop_and_create_all, setup_db, db, Drink
+from .auth.auth import AuthError, requires_auth, check_permissions, current_principal
+from .menu import MenuCache
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 setup_db(app)
@@ -18,12 +22,58 @@ CORS(app)
 '''
 # db_drop_and_create_all()
 
+'''
+The serialized menu, rebuilt after a drink is written
+'''
+menu = MenuCache(Drink)
+
 ## ROUTES
 def get_body(request):
     body = request.get_json()
     if body is None:
         abort(400)
     return body
+
+'''
+    returns the recipe sent for a drink as the JSON stored in Drink.recipe,
+    encoded once and without spaces
+    a single ingredient may be sent on its own rather than in a list
+    raises ValueError if it isn't a list of ingredients or doesn't fit the column
+'''
+def get_recipe_json(recipe):
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list) or not recipe:
+        raise ValueError('recipe must be a list of ingredients')
+    for ingredient in recipe:
+        if not isinstance(ingredient, dict) or \
+                not {'name', 'color', 'parts'} <= ingredient.keys():
+            raise ValueError('each ingredient needs a name, color and parts')
+    recipe_json = json.dumps([{
+        'name': ingredient['name'],
+        'color': ingredient['color'],
+        'parts': ingredient['parts']
+    } for ingredient in recipe], separators=(',', ':'))
+    if len(recipe_json) > Drink.recipe.type.length:
+        raise ValueError('recipe is too long')
+    return recipe_json
+
+'''
+    returns the menu in form ('short' or 'long') from the menu cache
+    with its ETag, or a 304 with no body if it matches If-None-Match
+    clients must revalidate before reusing it
+'''
+def get_menu_response(form, private=False):
+    body, etag = menu.get(form)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response.make_conditional(request)
+
 '''
     GET /drinks
         it is  a public endpoint
@@ -33,10 +83,7 @@ def get_body(request):
 '''
 @app.route('/drinks', methods=['GET'])
 def drinks():
-    return jsonify({
-        "success": True,
-        "drinks": [drink.short() for drink in Drink.query.all()]
-    })
+    return get_menu_response('short')
 
 
 '''
@@ -49,10 +96,7 @@ def drinks():
 @app.route('/drinks-detail', methods=['GET'])
 @requires_auth('get:drinks-detail')
 def drinks_details():
-    return jsonify({
-        "success": True,
-        "drinks": [drink.long() for drink in Drink.query.all()]
-    })
+    return get_menu_response('long', private=True)
 
 '''
     POST /drinks
@@ -67,21 +111,20 @@ def drinks_details():
 def add_drinks():
     body = get_body(request)
     try:
-        title = body.get('title', None)
-        recipe = [json.dumps(body.get('recipe', None))]
-    except:
-        abort(401)
+        new_drink = Drink(title=body.get('title', None),
+            recipe=get_recipe_json(body.get('recipe', None)))
+    except (AttributeError, ValueError):
+        abort(422)
 
     try:
-        new_drink = Drink(title=title, recipe=json.dumps(recipe))
-        print('test')
         new_drink.insert()
         return jsonify({
             "success": True,
-            "drinks": [drink.long() for drink in Drink.query.all()]
+            "drinks": [new_drink.long()]
         })
-    except Exception as e:
-        print(e)
+    except Exception:
+        db.session.rollback()
+        logger.exception('Unable to add drink')
         abort(422)
 
 '''
@@ -103,20 +146,23 @@ def update_drink(id):
     
     body = get_body(request)
     try:
-        title = body.get('title', None)
-    except:
-        abort(401)
+        if 'title' in body:
+            drink.title = body['title']
+        if 'recipe' in body:
+            drink.recipe = get_recipe_json(body['recipe'])
+    except (TypeError, ValueError):
+        abort(422)
     
     try:
-        drink.title = title
         drink.update()
 
         return jsonify({
             "success": True,
             "drinks": [drink.long()]
         }) 
-    except Exception as e:
-        print(e)
+    except Exception:
+        db.session.rollback()
+        logger.exception('Unable to update drink %s', id)
         abort(422)
 
 '''
@@ -144,6 +190,99 @@ def delete_drink(id):
     except:
         abort(422)
 
+'''
+    POST /drinks/batch
+        it creates or updates many drinks in one transaction
+        the body is {"drinks": [...]}, where each drink is either like the body
+            of POST /drinks, to create it, or has the "id" of an existing drink
+            and the fields to change, like PATCH /drinks/<id>
+        it requires the 'post:drinks' permission to create drinks and
+            the 'patch:drinks' permission to update them
+        if any drink is invalid or can't be saved, none are saved
+    returns status code 200 and json {"success": True, "drinks": drinks} where drinks are
+        the created and updated drinks in the order they were sent
+        or status code 422 and json {"success": False, ..., "errors": errors} where errors
+        gives the index of each drink at fault and why
+'''
+@app.route('/drinks/batch', methods=['POST'])
+@requires_auth(any_of=['post:drinks', 'patch:drinks'])
+def batch_drinks():
+    body = get_body(request)
+    items = body.get('drinks', None) if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        abort(400)
+
+    updates = [item for item in items if isinstance(item, dict) and 'id' in item]
+    if len(updates) < len(items):
+        check_permissions('post:drinks', current_principal())
+    if updates:
+        check_permissions('patch:drinks', current_principal())
+
+    ids = [item['id'] for item in updates if isinstance(item['id'], int)]
+    existing = {}
+    if ids:
+        existing = {drink.id: drink for drink in Drink.query.filter(Drink.id.in_(ids)).all()}
+
+    drinks = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            drinks.append(apply_drink(item, existing))
+        except ValueError as error:
+            errors.append({'index': index, 'message': str(error)})
+    if errors:
+        db.session.rollback()
+        return get_batch_error(errors)
+
+    try:
+        db.session.flush()
+        # read before the commit expires every drink.
+        saved = [drink.long() for drink in drinks]
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        logger.exception('Unable to save drinks')
+        return get_batch_error([{'index': None, 'message': 'drinks could not be saved'}])
+
+    return jsonify({
+        "success": True,
+        "drinks": saved
+    })
+
+'''
+    creates the drink item describes, or updates the drink in existing
+    whose id it has, in the session without committing
+    raises ValueError if the item isn't a valid drink or its id isn't an integer
+'''
+def apply_drink(item, existing):
+    if not isinstance(item, dict):
+        raise ValueError('drink must be an object')
+    if 'id' in item:
+        if not isinstance(item['id'], int) or isinstance(item['id'], bool):
+            raise ValueError('id must be an integer')
+        drink = existing.get(item['id'])
+        if drink is None:
+            raise ValueError('drink {} not found'.format(item['id']))
+        if 'title' in item:
+            drink.title = item['title']
+        if 'recipe' in item:
+            drink.recipe = get_recipe_json(item['recipe'])
+        return drink
+
+    if not item.get('title'):
+        raise ValueError('title is required')
+    drink = Drink(title=item['title'], recipe=get_recipe_json(item.get('recipe')))
+    db.session.add(drink)
+    return drink
+
+def get_batch_error(errors):
+    return jsonify({
+        'success': False,
+        'error': 422,
+        'message': 'Unprocessable entity',
+        'errors': errors
+    }), 422
+
 ## Error Handling
 '''
 Example error handling for unprocessable entity
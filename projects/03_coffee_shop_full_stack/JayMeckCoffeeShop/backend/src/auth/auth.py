@@ -1,14 +1,52 @@
-import json
+import os
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JwksCache, UrlJwksSource, FileJwksSource
+from .token_cache import TokenCache
+from .principal import Principal, PermissionRule, get_permission_rule
 
 
 AUTH0_DOMAIN = 'dev-fullstack.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee'
 
+## JWKS
+'''
+The signing keys are read from the Auth0 /.well-known/jwks.json
+endpoint, or from the file named by JWKS_FILE when it is set,
+and cached by kid in jwks_cache.
+'''
+JWKS_URL = f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
+
+def get_jwks_source():
+    jwks_file = os.environ.get('JWKS_FILE')
+    if jwks_file:
+        return FileJwksSource(jwks_file)
+    return UrlJwksSource(os.environ.get('JWKS_URL', JWKS_URL))
+
+jwks_cache = JwksCache(get_jwks_source())
+
+'''
+    @INPUTS
+        source: an object whose fetch() returns the key set, such as
+            a StaticJwksSource serving a local stand-in for Auth0
+
+    replaces where the signing keys come from and drops the cached keys
+'''
+def set_jwks_source(source):
+    jwks_cache.source = source
+    jwks_cache.clear()
+
+## Token Cache
+'''
+The Principal of each verified token, so a token sent again isn't
+verified again until it expires. token_cache.stats() gives its hit
+and miss counts.
+'''
+token_cache = TokenCache()
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -62,21 +100,24 @@ def get_token_auth_header():
 
 '''
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
-        payload: decoded jwt payload
+        permission: string permission (i.e. 'post:drink'), a list of
+            permissions that are all required or a PermissionRule
+        principal: the Principal of a verified token, or a decoded jwt payload
 
     it raises an AuthError if permissions are not included in the payload
-    it raises an AuthError if the requested permission string is not in the payload permissions array
+    it raises an AuthError if the principal's permissions don't satisfy the requested permission
     return true otherwise
 '''
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
+def check_permissions(permission, principal):
+    if not isinstance(principal, Principal):
+        principal = Principal(principal)
+    if principal.permissions is None:
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400)
 
-    if permission not in payload['permissions']:
+    if not get_permission_rule(permission).allows(principal.permissions):
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permission not found.'
@@ -88,33 +129,40 @@ def check_permissions(permission, payload):
         token: a json web token (string)
 
     The token should be an Auth0 token with key id (kid)
-    This method verifies the token using Auth0 /.well-known/jwks.json
+    This method verifies the token using the key with its kid from jwks_cache,
+    which holds the keys of Auth0 /.well-known/jwks.json
     it decodes the payload from the token
     it validate the claims
-    returns the decoded payload
+    returns the decoded payload, read only, from get_principal
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    return get_principal(token).payload
+
+'''
+    @INPUTS
+        token: a json web token (string)
+
+    returns the Principal of the token from token_cache, or verifies the
+    token with decode_jwt and keeps its Principal there until it expires
+'''
+def get_principal(token):
+    principal = token_cache.get(token)
+    if principal is None:
+        principal = Principal(decode_jwt(token))
+        token_cache.set(token, principal, principal.expires_at)
+    return principal
+
+def decode_jwt(token):
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -151,27 +199,53 @@ def verify_decode_jwt(token):
 '''
 implements @requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permissions: string permissions (i.e. 'post:drink') that are all required,
+            or a PermissionRule; none requires only a valid token
+        any_of: string permissions of which at least one is required (optional)
+
+    EXAMPLE
+        @requires_auth('get:drinks-detail')
+        @requires_auth('patch:drinks', 'post:drinks')
+        @requires_auth(any_of=['patch:drinks', 'post:drinks'])
 
+    the rule is built once, when the endpoint is decorated
     it uses the get_token_auth_header method to get the token
-    it uses the verify_decode_jwt method to decode the jwt
+    it uses the get_principal method to decode the jwt
     it uses the check_permissions method validate claims and check the requested permission
-    return the decorator which passes the decoded payload to the decorated method
+    it keeps the Principal for the request, see current_principal()
+    return the decorator
 '''
-def requires_auth(permission=''):
+def requires_auth(*permissions, any_of=()):
+    if len(permissions) == 1 and isinstance(permissions[0], PermissionRule):
+        rule = permissions[0]
+    else:
+        rule = PermissionRule(
+            all_of=[permission for permission in permissions if permission],
+            any_of=any_of)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
             try:
-                payload = verify_decode_jwt(token)
+                principal = get_principal(token)
             except:
                 raise AuthError({
                     'code': 'invalid_header',
                     'description': 'Unathorized'
                 }, 401)
             
-            check_permissions(permission, payload)
+            check_permissions(rule, principal)
+            _request_ctx_stack.top.current_principal = principal
             return f(*args, **kwargs)
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
+
+'''
+returns the Principal that requires_auth verified for this request,
+so an endpoint can make further checks without decoding the token again
+    EXAMPLE
+        check_permissions('delete:drinks', current_principal())
+'''
+def current_principal():
+    return getattr(_request_ctx_stack.top, 'current_principal', None)
\ No newline at end of file
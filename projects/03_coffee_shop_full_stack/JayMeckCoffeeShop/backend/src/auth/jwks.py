@@ -0,0 +1,168 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+# How long fetched keys are used before they are refreshed.
+JWKS_TTL = 10 * 60
+# How long past JWKS_TTL keys are still used while a refresh runs
+# in the background, or while the key set can't be fetched.
+JWKS_STALE_TTL = 24 * 60 * 60
+# Least time between two fetches forced by an unknown kid.
+JWKS_MIN_REFETCH_INTERVAL = 30
+JWKS_FETCH_TIMEOUT = 5
+
+## JWKS Sources
+'''
+A source returns the JSON Web Key Set as a dict with a 'keys' list.
+Any object with a fetch() method will do.
+'''
+class UrlJwksSource:
+    def __init__(self, url, timeout=JWKS_FETCH_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        with urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+'''
+Reads the key set from a file, such as one saved from the
+/.well-known/jwks.json endpoint, to run without the network.
+'''
+class FileJwksSource:
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path) as jwks_file:
+            return json.load(jwks_file)
+
+'''
+Serves a key set held in memory, for tests and local stand-ins.
+'''
+class StaticJwksSource:
+    def __init__(self, jwks):
+        self.jwks = jwks
+
+    def fetch(self):
+        return self.jwks
+
+
+## JWKS Cache
+'''
+JwksCache
+    Holds the RSA keys of a JWKS source by kid, so verifying a token
+    doesn't fetch the key set.
+
+    Keys are fetched on first use and used for ttl seconds. After
+    that the cached keys are still served while one background
+    thread refreshes them, for up to stale_ttl more seconds. Only
+    when they are older than that does a request wait for a fetch.
+    A failed fetch keeps the old keys, so an outage of the identity
+    provider doesn't fail requests while the keys are still usable.
+
+    A kid that isn't cached forces a fetch, as the provider may have
+    rotated its keys, but at most once every min_refetch_interval
+    seconds, so tokens with made-up kids can't flood the provider.
+'''
+class JwksCache:
+    def __init__(self, source, ttl=JWKS_TTL, stale_ttl=JWKS_STALE_TTL,
+            min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL):
+        self.source = source
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.lock = threading.Lock()
+        # held while fetching, so waiting threads reuse one fetch.
+        self.fetch_lock = threading.Lock()
+        self.keys = {}
+        self.fetched_at = None
+        self.last_attempt = None
+        self.refreshing = False
+
+    '''
+        @INPUTS
+            kid: the key id from the header of a token
+
+        returns the RSA key with that kid, or None if the source has none
+    '''
+    def get_key(self, kid):
+        now = time.monotonic()
+        age = None if self.fetched_at is None else now - self.fetched_at
+
+        if age is None or age > self.ttl + self.stale_ttl:
+            if self.can_refetch():
+                self.refresh()
+        elif age > self.ttl:
+            self.refresh_in_background()
+
+        key = self.keys.get(kid)
+        if key is None and self.can_refetch():
+            self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    def can_refetch(self):
+        return self.last_attempt is None or \
+            time.monotonic() - self.last_attempt >= self.min_refetch_interval
+
+    '''
+    fetches the key set now, keeping the old keys if that fails.
+    '''
+    def refresh(self):
+        started = time.monotonic()
+        with self.fetch_lock:
+            if self.fetched_at is not None and self.fetched_at >= started:
+                return
+            self.fetch()
+
+    def fetch(self):
+        with self.lock:
+            self.last_attempt = time.monotonic()
+        try:
+            jwks = self.source.fetch()
+        except Exception:
+            logger.exception('Unable to fetch the JWKS')
+            return
+        keys = {}
+        for key in jwks.get('keys', []):
+            if 'kid' not in key or key.get('kty') != 'RSA':
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use'),
+                'n': key['n'],
+                'e': key['e']
+            }
+        with self.lock:
+            self.keys = keys
+            self.fetched_at = time.monotonic()
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self.lock:
+                    self.refreshing = False
+
+        threading.Thread(target=run, name='jwks-refresh', daemon=True).start()
+
+    '''
+    drops the cached keys so the next token fetches them again.
+    '''
+    def clear(self):
+        with self.lock:
+            self.keys = {}
+            self.fetched_at = None
+            self.last_attempt = None
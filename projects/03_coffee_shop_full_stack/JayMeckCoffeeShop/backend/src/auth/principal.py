@@ -0,0 +1,67 @@
+from types import MappingProxyType
+
+## Principal
+'''
+Principal
+    The caller a verified token stands for, built once from its
+    payload and cached with the token. permissions is a frozenset,
+    so every check against it is a set lookup, or None if the token
+    has no permissions claim.
+
+    payload is the decoded token, read only as it is shared by every
+    request that sends the same token.
+'''
+class Principal:
+    __slots__ = ('subject', 'permissions', 'expires_at', 'payload')
+
+    def __init__(self, payload):
+        self.subject = payload.get('sub')
+        permissions = payload.get('permissions')
+        self.permissions = None if permissions is None else frozenset(permissions)
+        self.expires_at = payload.get('exp')
+        self.payload = MappingProxyType(dict(payload))
+
+    def __repr__(self):
+        return 'Principal({!r})'.format(self.subject)
+
+
+## Permission Rules
+'''
+PermissionRule
+    The permissions an endpoint requires: every permission in
+    all_of and, when any_of isn't empty, at least one of any_of.
+    Rules are built once when an endpoint is decorated.
+'''
+class PermissionRule:
+    __slots__ = ('all_of', 'any_of')
+
+    def __init__(self, all_of=(), any_of=()):
+        self.all_of = frozenset(all_of)
+        self.any_of = frozenset(any_of)
+
+    '''
+        @INPUTS
+            permissions: frozenset of the permissions of a principal
+
+        returns true if they satisfy the rule
+    '''
+    def allows(self, permissions):
+        if not self.all_of <= permissions:
+            return False
+        return not self.any_of or not self.any_of.isdisjoint(permissions)
+
+    def __repr__(self):
+        return 'PermissionRule(all_of={}, any_of={})'.format(
+            sorted(self.all_of), sorted(self.any_of))
+
+'''
+returns the permission rule for permission, which is either a
+PermissionRule, one permission string or a list of permissions that
+are all required. An empty string requires no permission.
+'''
+def get_permission_rule(permission):
+    if isinstance(permission, PermissionRule):
+        return permission
+    if isinstance(permission, str):
+        return PermissionRule(all_of=[permission] if permission else [])
+    return PermissionRule(all_of=permission)
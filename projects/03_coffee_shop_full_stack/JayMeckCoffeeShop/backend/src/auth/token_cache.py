@@ -0,0 +1,82 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+TOKEN_CACHE_SIZE = 1024
+
+## Token Cache
+'''
+TokenCache
+    Holds what was decoded from tokens that have been verified, so
+    a token sent again skips its signature check. Entries are keyed
+    by a SHA-256 of the token, so the cache never holds a usable
+    token, and each one is dropped when its token expires. Once
+    maxsize tokens are held the least recently used one is dropped.
+
+    hits and misses count the lookups, see stats().
+'''
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    '''
+        @INPUTS
+            token: a json web token (string)
+
+        returns what was stored for the token, or None if it isn't
+        cached or has expired
+    '''
+    def get(self, token):
+        key = get_token_key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    '''
+        @INPUTS
+            token: a json web token (string) that has been verified
+            value: what to return for it
+            expires_at: the exp claim of the token, in seconds since the epoch
+    '''
+    def set(self, token, value, expires_at):
+        if expires_at is None or expires_at <= time.time():
+            return
+        key = get_token_key(token)
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    '''
+    returns the hit and miss counts and the number of tokens held
+    '''
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries)
+            }
+
+def get_token_key(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
@@ -1,23 +1,69 @@
 import os
-from sqlalchemy import Column, String, Integer
+import re
+import logging
+from sqlalchemy import Column, String, Integer, event
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .recipes import ParsedRecipe, RecipeCache
+from .query_stats import QueryStats
+
+logger = logging.getLogger(__name__)
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
+'''
+query_stats
+    counts the statements each request runs, see query_stats.py
+'''
+query_stats = QueryStats()
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    sqlite_pragmas are (name, value) pairs run as PRAGMAs on every
+    new connection, by default those of get_sqlite_pragmas
 '''
-def setup_db(app):
+def setup_db(app, sqlite_pragmas=None):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if sqlite_pragmas is None:
+        sqlite_pragmas = get_sqlite_pragmas(app.config)
     db.app = app
     db.init_app(app)
+    if sqlite_pragmas:
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in sqlite_pragmas:
+                cursor.execute('PRAGMA {}={}'.format(name, value))
+            cursor.close()
+        event.listen(db.get_engine(app), 'connect', set_pragmas)
+    query_stats.init_app(app, db)
+
+PRAGMA = re.compile(r'^\s*(\w+)\s*=\s*([\w-]+)\s*$')
+
+'''
+get_sqlite_pragmas(config)
+    returns the (name, value) pairs of DB_SQLITE_PRAGMAS in config, or
+    else the environment, such as 'journal_mode=WAL,busy_timeout=5000'
+    raises ValueError for anything that isn't name=value, as they end
+    up in PRAGMA statements
+'''
+def get_sqlite_pragmas(config):
+    setting = config.get('DB_SQLITE_PRAGMAS') or os.environ.get('DB_SQLITE_PRAGMAS') or ''
+    pragmas = []
+    for item in setting.split(','):
+        if not item.strip():
+            continue
+        match = PRAGMA.match(item)
+        if match is None:
+            raise ValueError('Invalid SQLite pragma: {!r}'.format(item))
+        pragmas.append(match.groups())
+    return pragmas
 
 '''
 db_drop_and_create_all()
@@ -42,13 +88,28 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False) 
 
+    '''
+    parsed_recipe()
+        the recipe as a ParsedRecipe, whose ingredients are a tuple of
+        Ingredient(name, color, parts)
+        it is parsed once per recipe blob of the drink and then
+        shared from recipe_cache
+    '''
+    def parsed_recipe(self):
+        if self.id is None:
+            return ParsedRecipe.from_json(self.recipe)
+        return recipe_cache.get(self.id, self.recipe)
+
+    def ingredients(self):
+        return self.parsed_recipe().ingredients
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        short_recipe = self.parsed_recipe().short
+        logger.debug('short recipe of drink %s: %s', self.id, short_recipe)
         return {
             'id': self.id,
             'title': self.title,
@@ -63,7 +124,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.parsed_recipe().long
         }
 
     '''
@@ -104,4 +165,6 @@ class Drink(db.Model):
         db.session.commit()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+recipe_cache = RecipeCache()
\ No newline at end of file
@@ -0,0 +1,136 @@
+from collections import Counter
+from contextlib import contextmanager
+import logging
+import re
+import time
+
+from flask import _request_ctx_stack, current_app
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# A statement run this many times in one request is reported as a
+# likely N+1, a lazy load per row of an earlier query.
+REPEAT_THRESHOLD = 5
+
+## Request Queries
+'''
+RequestQueries
+    The statements one request, or one expect() block, ran: how
+    many, their total time in seconds and how often each statement
+    fingerprint was seen.
+'''
+class RequestQueries:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[fingerprint(statement)] += 1
+
+    '''
+        returns [(fingerprint, times)] of the statements run at least
+        threshold times, the most repeated first.
+    '''
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        return [(statement, times) for statement, times in self.fingerprints.most_common()
+            if times >= threshold]
+
+## Query Stats
+'''
+QueryStats
+    Counts the SQL statements each request runs, from the cursor
+    events of the engine of db. In debug mode, or when the
+    QUERY_STATS_HEADERS setting is true, every response gets
+
+        X-Query-Count     statements run
+        X-Query-Time      their total time in milliseconds
+        X-Query-Repeated  fingerprints run REPEAT_THRESHOLD times or more
+
+    and repeated fingerprints are logged as likely N+1 queries.
+'''
+class QueryStats:
+    def __init__(self, repeat_threshold=REPEAT_THRESHOLD):
+        self.repeat_threshold = repeat_threshold
+        self.recorders = []
+
+    def init_app(self, app, db):
+        engine = db.get_engine(app)
+        if not event.contains(engine, 'before_cursor_execute', self.before_execute):
+            event.listen(engine, 'before_cursor_execute', self.before_execute)
+            event.listen(engine, 'after_cursor_execute', self.after_execute)
+        app.config.setdefault('QUERY_STATS_HEADERS', app.debug)
+        app.after_request(self.add_headers)
+        app.extensions['query_stats'] = self
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_start'].pop()
+        queries = current_queries(create=True)
+        if queries is not None:
+            queries.add(statement, seconds)
+        for recorder in self.recorders:
+            recorder.add(statement, seconds)
+
+    def add_headers(self, response):
+        queries = current_queries() or RequestQueries()
+        repeated = queries.repeated(self.repeat_threshold)
+        for statement, times in repeated:
+            logger.warning('Likely N+1: %d x %s', times, statement)
+        if current_app.config.get('QUERY_STATS_HEADERS'):
+            response.headers['X-Query-Count'] = str(queries.count)
+            response.headers['X-Query-Time'] = '{:.1f}'.format(queries.seconds * 1000)
+            response.headers['X-Query-Repeated'] = str(len(repeated))
+        return response
+
+    '''
+        fails with an AssertionError, listing what ran, if the block
+        runs more than budget statements.
+
+            with query_stats.expect(3):
+                client.get('/drinks')
+    '''
+    @contextmanager
+    def expect(self, budget):
+        queries = RequestQueries()
+        self.recorders.append(queries)
+        try:
+            yield queries
+        finally:
+            self.recorders.remove(queries)
+        if queries.count > budget:
+            raise AssertionError('{} queries run, {} expected at most:\n{}'.format(
+                queries.count, budget, '\n'.join('{} x {}'.format(times, statement)
+                    for statement, times in queries.fingerprints.most_common())))
+
+'''
+    returns the RequestQueries of the current request, or None outside
+    a request. create adds one to the request if it has none.
+'''
+def current_queries(create=False):
+    ctx = _request_ctx_stack.top
+    if ctx is None:
+        return None
+    queries = getattr(ctx, 'queries', None)
+    if queries is None and create:
+        queries = ctx.queries = RequestQueries()
+    return queries
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PARAM = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+IN_LIST = re.compile(r'\bIN\s*\((?:\s*' + PARAM + r'\s*,?)+\)', re.IGNORECASE)
+SPACE = re.compile(r'\s+')
+
+'''
+    returns statement with its literals and IN lists replaced by ?,
+    so the same query for different rows has one fingerprint.
+'''
+def fingerprint(statement):
+    statement = LITERAL.sub('?', statement)
+    statement = IN_LIST.sub('IN (?)', statement)
+    return SPACE.sub(' ', statement).strip()
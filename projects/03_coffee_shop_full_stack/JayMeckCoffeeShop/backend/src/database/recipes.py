@@ -0,0 +1,117 @@
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+RECIPE_CACHE_SIZE = 10000
+
+'''
+Ingredient
+    one part of a drink recipe, the structured form of an item of
+    the recipe blob {'color': string, 'name': string, 'parts': number}
+'''
+class Ingredient(namedtuple('Ingredient', ['name', 'color', 'parts'])):
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(item.get('name'), item.get('color'), item.get('parts'))
+
+    def long(self):
+        return {'color': self.color, 'name': self.name, 'parts': self.parts}
+
+'''
+ParsedRecipe
+    a recipe blob decoded once. long is the list of ingredient dicts
+    as decoded, short and ingredients are built from it the first time
+    they are read. They are shared by every call, so they must only be
+    read.
+'''
+class ParsedRecipe:
+    __slots__ = ('long', '_short', '_ingredients')
+
+    def __init__(self, items):
+        self.long = items
+        self._short = None
+        self._ingredients = None
+
+    @classmethod
+    def from_json(cls, recipe):
+        return cls(get_recipe_items(json.loads(recipe)))
+
+    @property
+    def short(self):
+        if self._short is None:
+            self._short = [{'color': r.get('color'), 'parts': r.get('parts')} for r in self.long]
+        return self._short
+
+    '''
+    the ingredients as a tuple of Ingredient(name, color, parts)
+    '''
+    @property
+    def ingredients(self):
+        if self._ingredients is None:
+            self._ingredients = tuple(Ingredient.from_dict(item) for item in self.long)
+        return self._ingredients
+
+'''
+get_recipe_items(recipe)
+    returns the ingredient dicts of a decoded recipe blob
+    a single ingredient may be stored on its own, and older rows hold
+    each item JSON encoded a second time, both are read here
+'''
+def get_recipe_items(recipe):
+    if isinstance(recipe, dict):
+        return [recipe]
+    if not recipe:
+        return []
+    for item in recipe:
+        if isinstance(item, str):
+            break
+    else:
+        return recipe
+    items = []
+    for item in recipe:
+        if isinstance(item, str):
+            items.extend(get_recipe_items(json.loads(item)))
+        else:
+            items.append(item)
+    return items
+
+'''
+RecipeCache
+    ParsedRecipes keyed by drink id, each kept with the recipe blob
+    it was parsed from, so a drink's recipe is decoded again only
+    once the blob changes rather than on every short() or long().
+    It holds at most maxsize recipes and drops the least recently
+    used one past that.
+'''
+class RecipeCache:
+    def __init__(self, maxsize=RECIPE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    '''
+    returns the ParsedRecipe of recipe cached for key, parsing and
+    caching it if there is none or it was parsed from another recipe
+    '''
+    def get(self, key, recipe):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == recipe:
+                self.entries.move_to_end(key)
+                return entry[1]
+        parsed = ParsedRecipe.from_json(recipe)
+        self.set(key, recipe, parsed)
+        return parsed
+
+    def set(self, key, recipe, parsed):
+        with self.lock:
+            self.entries[key] = (recipe, parsed)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
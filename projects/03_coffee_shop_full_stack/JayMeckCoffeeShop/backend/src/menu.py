@@ -0,0 +1,92 @@
+import hashlib
+import json
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# How long a built menu is served. Writes in this process rebuild it
+# at once, this covers writes from other processes.
+MENU_CACHE_SECONDS = 60
+
+## Menu Cache
+'''
+MenuCache
+    The whole drink menu serialized for GET /drinks (short) and
+    GET /drinks-detail (long), as the bytes of the response body,
+    each with a strong ETag that is a digest of those bytes.
+
+    Both forms are built together from one query, the first time
+    they are asked for after a write. Any commit that inserted,
+    updated or deleted a model_class row marks them stale.
+
+    model_class: the Drink model, it must have short() and long().
+'''
+class MenuCache:
+    def __init__(self, model_class, max_age=MENU_CACHE_SECONDS):
+        self.model_class = model_class
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.version = 0
+        self.built_version = None
+        self.built_at = None
+        self.bodies = {}
+        event.listen(Session, 'after_flush', self.on_flush)
+        event.listen(Session, 'after_commit', self.on_commit)
+        event.listen(Session, 'after_rollback', self.on_rollback)
+
+    '''
+        @INPUTS
+            form: 'short' or 'long'
+
+        returns (body, etag) of the menu in that form
+    '''
+    def get(self, form):
+        with self.lock:
+            stale = self.built_at is None or \
+                time.monotonic() - self.built_at > self.max_age
+            if stale or self.built_version != self.version:
+                self.build()
+            return self.bodies[form]
+
+    def build(self):
+        version = self.version
+        drinks = self.model_class.query.order_by(self.model_class.id).all()
+        self.bodies = {
+            'short': get_body([drink.short() for drink in drinks]),
+            'long': get_body([drink.long() for drink in drinks])
+        }
+        self.built_version = version
+        self.built_at = time.monotonic()
+
+    '''
+    marks the menu stale so the next request builds it again
+    '''
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+
+    def on_flush(self, session, flush_context):
+        for instance in (session.new | session.dirty | session.deleted):
+            if isinstance(instance, self.model_class):
+                session.info['menu_changed'] = True
+                return
+
+    def on_commit(self, session):
+        if session.info.pop('menu_changed', False):
+            self.invalidate()
+
+    def on_rollback(self, session):
+        session.info.pop('menu_changed', None)
+
+'''
+returns (body, etag), the body being the bytes of the JSON the drink
+endpoints send for drinks
+'''
+def get_body(drinks):
+    body = json.dumps({
+        'success': True,
+        'drinks': drinks
+    }, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.sha256(body).hexdigest()
@@ -0,0 +1,163 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.database import models
+
+# api sets up the database on import, so point it at a scratch one first
+database_dir = tempfile.mkdtemp()
+models.database_path = 'sqlite:///{}'.format(os.path.join(database_dir, 'test.db'))
+
+from src.api import app, menu
+from src.auth.auth import token_cache
+from src.auth.principal import Principal
+from src.database.models import db, Drink, query_stats
+
+RECIPE = [{'name': 'water', 'color': 'blue', 'parts': 1}]
+
+
+def get_auth_headers(*permissions):
+    '''
+    returns headers with a token for permissions, put in the token
+    cache as if it had been verified, so no signing key is needed
+    '''
+    token = 'token-{}'.format('-'.join(permissions) or 'none')
+    expires_at = time.time() + 3600
+    token_cache.set(token, Principal({
+        'sub': 'tester',
+        'permissions': list(permissions),
+        'exp': expires_at
+    }), expires_at)
+    return {'Authorization': 'Bearer {}'.format(token)}
+
+
+class CoffeeShopTestCase(unittest.TestCase):
+    """This class represents the coffee shop test case"""
+
+    def setUp(self):
+        self.client = app.test_client
+        with app.app_context():
+            db.create_all()
+            for number in range(20):
+                Drink(title='Drink {}'.format(number),
+                      recipe='[{"name":"water","color":"blue","parts":1}]').insert()
+        menu.invalidate()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_GET_drinks(self):
+        res = self.client().get('/drinks')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.get_json()['drinks']), 20)
+
+    def test_GET_drinks_query_budget(self):
+        with query_stats.expect(1):
+            res = self.client().get('/drinks')
+        self.assertEqual(res.status_code, 200)
+        with query_stats.expect(0):
+            res = self.client().get('/drinks')
+        self.assertEqual(res.status_code, 200)
+
+    def test_GET_drinks_query_budget_after_write(self):
+        self.client().get('/drinks')
+        with app.app_context():
+            drink = Drink.query.first()
+            drink.title = 'Renamed'
+            drink.update()
+        with query_stats.expect(1):
+            res = self.client().get('/drinks')
+        self.assertIn('Renamed', [drink['title'] for drink in res.get_json()['drinks']])
+
+    def test_recipe_parsed_again_when_changed(self):
+        with app.app_context():
+            drink = Drink.query.get(1)
+            self.assertEqual(drink.long()['recipe'], RECIPE)
+            self.assertIs(drink.parsed_recipe(), drink.parsed_recipe())
+            drink.recipe = '[{"name":"milk","color":"white","parts":2}]'
+            drink.update()
+            self.assertEqual(Drink.query.get(1).short()['recipe'], [{'color': 'white', 'parts': 2}])
+
+    def test_query_stats_repeated(self):
+        with app.app_context():
+            with query_stats.expect(20) as queries:
+                for id in range(1, 21):
+                    Drink.query.get(id)
+        self.assertEqual(queries.count, 20)
+        self.assertEqual([times for statement, times in queries.repeated()], [20])
+
+    def test_query_budget_exceeded(self):
+        with self.assertRaises(AssertionError):
+            with query_stats.expect(0):
+                self.client().get('/drinks')
+
+    def test_POST_drinks_returns_new_drink(self):
+        res = self.client().post('/drinks', headers=get_auth_headers('post:drinks'),
+            json={'title': 'Tea', 'recipe': RECIPE})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['drinks']), 1)
+        self.assertEqual(data['drinks'][0]['title'], 'Tea')
+        self.assertEqual(data['drinks'][0]['recipe'], RECIPE)
+
+    def test_POST_drinks_batch_creates_and_updates(self):
+        headers = get_auth_headers('post:drinks', 'patch:drinks')
+        res = self.client().post('/drinks/batch', headers=headers, json={'drinks': [
+            {'title': 'Tea', 'recipe': RECIPE},
+            {'id': 1, 'title': 'Renamed'}
+        ]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([drink['title'] for drink in data['drinks']], ['Tea', 'Renamed'])
+        with app.app_context():
+            self.assertEqual(Drink.query.count(), 21)
+            self.assertEqual(Drink.query.get(1).title, 'Renamed')
+
+    def test_POST_drinks_batch_create_needs_post_permission(self):
+        res = self.client().post('/drinks/batch', headers=get_auth_headers('patch:drinks'),
+            json={'drinks': [{'title': 'Tea', 'recipe': RECIPE}]})
+        self.assertEqual(res.status_code, 401)
+
+    def test_POST_drinks_batch_update_needs_patch_permission(self):
+        res = self.client().post('/drinks/batch', headers=get_auth_headers('post:drinks'),
+            json={'drinks': [{'id': 1, 'title': 'Renamed'}]})
+        self.assertEqual(res.status_code, 401)
+        res = self.client().post('/drinks/batch', headers=get_auth_headers('patch:drinks'),
+            json={'drinks': [{'id': 1, 'title': 'Renamed'}]})
+        self.assertEqual(res.status_code, 200)
+
+    def test_POST_drinks_batch_needs_a_drinks_permission(self):
+        res = self.client().post('/drinks/batch', headers=get_auth_headers('get:drinks-detail'),
+            json={'drinks': [{'title': 'Tea', 'recipe': RECIPE}]})
+        self.assertEqual(res.status_code, 401)
+
+    def test_POST_drinks_batch_bad_item_saves_nothing(self):
+        headers = get_auth_headers('post:drinks', 'patch:drinks')
+        res = self.client().post('/drinks/batch', headers=headers, json={'drinks': [
+            {'title': 'Tea', 'recipe': RECIPE},
+            {'id': 1, 'title': 'Renamed'},
+            {'title': 'No recipe'}
+        ]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual([error['index'] for error in data['errors']], [2])
+        with app.app_context():
+            self.assertEqual(Drink.query.count(), 20)
+            self.assertEqual(Drink.query.get(1).title, 'Drink 0')
+
+    def test_POST_drinks_batch_id_not_an_integer(self):
+        headers = get_auth_headers('patch:drinks')
+        for id in ([1], {'id': 1}, '1', True):
+            res = self.client().post('/drinks/batch', headers=headers,
+                json={'drinks': [{'id': id, 'title': 'Renamed'}]})
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(res.get_json()['errors'],
+                [{'index': 0, 'message': 'id must be an integer'}])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+import base64
+import threading
+import time
+import unittest
+from unittest import mock
+
+from Crypto.PublicKey import RSA
+from flask import Flask, jsonify
+from jose import jwt
+
+from src.auth import auth
+from src.auth.jwks import JwksCache, StaticJwksSource
+from src.auth.principal import Principal, PermissionRule
+from src.auth.token_cache import TokenCache
+
+KEY = {'kty': 'RSA', 'kid': 'key-1', 'use': 'sig', 'n': 'AQAB', 'e': 'AQAB'}
+ROTATED_KEY = dict(KEY, kid='key-2')
+
+# A signing key standing in for Auth0's, served by a StaticJwksSource.
+SIGNING_KEY = RSA.generate(2048)
+
+
+def get_base64url(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+SIGNING_JWKS = {'keys': [{
+    'kty': 'RSA',
+    'kid': 'signing-key',
+    'use': 'sig',
+    'n': get_base64url(SIGNING_KEY.n),
+    'e': get_base64url(SIGNING_KEY.e)
+}]}
+
+
+def make_token(permissions=(), expires_in=3600, subject='tester'):
+    '''returns a token signed with SIGNING_KEY, as Auth0 would issue it'''
+    return jwt.encode({
+        'sub': subject,
+        'aud': auth.API_AUDIENCE,
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'exp': int(time.time()) + expires_in,
+        'permissions': list(permissions)
+    }, SIGNING_KEY.export_key().decode('ascii'), algorithm='RS256',
+        headers={'kid': 'signing-key'})
+
+
+class CountingJwksSource(StaticJwksSource):
+    """A StaticJwksSource that counts its fetches, and fails them
+    while failing is set."""
+
+    def __init__(self, jwks):
+        super().__init__(jwks)
+        self.fetches = 0
+        self.failing = False
+
+    def fetch(self):
+        self.fetches += 1
+        if self.failing:
+            raise OSError('identity provider unreachable')
+        return super().fetch()
+
+
+class JwksCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test case"""
+
+    def setUp(self):
+        self.source = CountingJwksSource({'keys': [KEY]})
+        self.cache = JwksCache(self.source, ttl=60, stale_ttl=600,
+            min_refetch_interval=30)
+
+    def age_keys(self, seconds):
+        with self.cache.lock:
+            self.cache.fetched_at -= seconds
+            self.cache.last_attempt -= seconds
+
+    def wait_for_refresh(self):
+        deadline = time.monotonic() + 5
+        while self.cache.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_key_fetched_once(self):
+        self.assertEqual(self.cache.get_key('key-1')['n'], KEY['n'])
+        self.assertEqual(self.cache.get_key('key-1')['n'], KEY['n'])
+        self.assertEqual(self.source.fetches, 1)
+
+    def test_unknown_kid_refetched_once(self):
+        self.cache.get_key('key-1')
+        for _ in range(5):
+            self.assertIsNone(self.cache.get_key('made-up'))
+        self.assertEqual(self.source.fetches, 1)
+
+        self.age_keys(31)
+        self.assertIsNone(self.cache.get_key('made-up'))
+        self.assertIsNone(self.cache.get_key('made-up'))
+        self.assertEqual(self.source.fetches, 2)
+
+    def test_rotated_key_found_by_refetch(self):
+        self.cache.get_key('key-1')
+        self.age_keys(31)
+        self.source.jwks = {'keys': [KEY, ROTATED_KEY]}
+        self.assertEqual(self.cache.get_key('key-2')['kid'], 'key-2')
+        self.assertEqual(self.source.fetches, 2)
+
+    def test_stale_keys_served_while_source_fails(self):
+        self.cache.get_key('key-1')
+        self.source.failing = True
+
+        self.age_keys(61)
+        self.assertEqual(self.cache.get_key('key-1')['kid'], 'key-1')
+        self.wait_for_refresh()
+        self.assertEqual(self.source.fetches, 2)
+
+        self.age_keys(600)
+        self.assertEqual(self.cache.get_key('key-1')['kid'], 'key-1')
+        self.assertEqual(self.source.fetches, 3)
+
+    def test_keys_refreshed_in_background(self):
+        self.cache.get_key('key-1')
+        self.age_keys(61)
+        self.source.jwks = {'keys': [ROTATED_KEY]}
+        # the old key is served, unless the refresh has already run.
+        self.cache.get_key('key-1')
+        self.wait_for_refresh()
+        self.assertEqual(self.cache.get_key('key-2')['kid'], 'key-2')
+        self.assertEqual(self.source.fetches, 2)
+
+    def test_concurrent_unknown_kids_share_one_fetch(self):
+        self.cache.get_key('key-1')
+        self.age_keys(31)
+        threads = [threading.Thread(target=self.cache.get_key, args=('made-up',))
+            for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.source.fetches, 2)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def setUp(self):
+        auth.set_jwks_source(StaticJwksSource(SIGNING_JWKS))
+        auth.token_cache.clear()
+
+    def test_token_verified_once(self):
+        token = make_token(['get:drinks-detail'])
+        with mock.patch.object(auth, 'decode_jwt', wraps=auth.decode_jwt) as decode_jwt:
+            first = auth.get_principal(token)
+            second = auth.get_principal(token)
+        self.assertIs(first, second)
+        self.assertEqual(decode_jwt.call_count, 1)
+        self.assertEqual(first.permissions, frozenset(['get:drinks-detail']))
+
+    def test_expired_token_not_cached(self):
+        token = make_token(expires_in=-10)
+        with self.assertRaises(auth.AuthError):
+            auth.get_principal(token)
+        self.assertEqual(auth.token_cache.stats()['size'], 0)
+
+    def test_cached_token_dropped_at_exp(self):
+        cache = TokenCache()
+        now = time.time()
+        principal = Principal({'sub': 'tester', 'exp': now + 60})
+        cache.set('token', principal, now + 60)
+        with mock.patch('src.auth.token_cache.time.time', return_value=now + 59):
+            self.assertIs(cache.get('token'), principal)
+        with mock.patch('src.auth.token_cache.time.time', return_value=now + 60):
+            self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 0})
+
+    def test_least_recently_used_token_dropped(self):
+        cache = TokenCache(maxsize=2)
+        expires_at = time.time() + 60
+        for token in ('a', 'b'):
+            cache.set(token, token, expires_at)
+        cache.get('a')
+        cache.set('c', 'c', expires_at)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('c'), 'c')
+
+
+def create_test_app():
+    '''returns an app with an endpoint per kind of permission rule'''
+    app = Flask(__name__)
+
+    @app.route('/all')
+    @auth.requires_auth('patch:drinks', 'post:drinks')
+    def all_of():
+        return jsonify({'success': True})
+
+    @app.route('/any')
+    @auth.requires_auth(any_of=['patch:drinks', 'post:drinks'])
+    def any_of():
+        return jsonify({'success': True})
+
+    @app.route('/both')
+    @auth.requires_auth('get:drinks-detail', any_of=['patch:drinks', 'post:drinks'])
+    def both():
+        return jsonify({'success': True})
+
+    @app.errorhandler(auth.AuthError)
+    def handle_auth_error(error):
+        return jsonify(error.error), error.status_code
+
+    return app
+
+
+class RequiresAuthTestCase(unittest.TestCase):
+    """This class represents the requires_auth permission rules test case"""
+
+    def setUp(self):
+        auth.set_jwks_source(StaticJwksSource(SIGNING_JWKS))
+        auth.token_cache.clear()
+        self.client = create_test_app().test_client
+
+    def get_status(self, url, *permissions):
+        headers = {'Authorization': 'Bearer ' + make_token(permissions)}
+        return self.client().get(url, headers=headers).status_code
+
+    def test_all_of(self):
+        self.assertEqual(self.get_status('/all', 'patch:drinks', 'post:drinks'), 200)
+        self.assertEqual(self.get_status('/all', 'patch:drinks'), 401)
+        self.assertEqual(self.get_status('/all', 'post:drinks'), 401)
+        self.assertEqual(self.get_status('/all'), 401)
+
+    def test_any_of(self):
+        self.assertEqual(self.get_status('/any', 'patch:drinks'), 200)
+        self.assertEqual(self.get_status('/any', 'post:drinks'), 200)
+        self.assertEqual(self.get_status('/any', 'get:drinks-detail'), 401)
+        self.assertEqual(self.get_status('/any'), 401)
+
+    def test_all_of_and_any_of(self):
+        self.assertEqual(self.get_status('/both', 'get:drinks-detail', 'post:drinks'), 200)
+        self.assertEqual(self.get_status('/both', 'get:drinks-detail'), 401)
+        self.assertEqual(self.get_status('/both', 'post:drinks', 'patch:drinks'), 401)
+
+    def test_missing_token(self):
+        self.assertEqual(self.client().get('/any').status_code, 401)
+
+    def test_token_without_permissions_claim(self):
+        with self.assertRaises(auth.AuthError) as raised:
+            auth.check_permissions('post:drinks', {'sub': 'tester'})
+        self.assertEqual(raised.exception.status_code, 400)
+
+    def test_permission_rule(self):
+        rule = PermissionRule(all_of=['a'], any_of=['b', 'c'])
+        self.assertTrue(rule.allows(frozenset(['a', 'c'])))
+        self.assertFalse(rule.allows(frozenset(['a'])))
+        self.assertFalse(rule.allows(frozenset(['b', 'c'])))
+        self.assertTrue(PermissionRule().allows(frozenset()))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
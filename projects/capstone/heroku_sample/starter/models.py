@@ -1,7 +1,14 @@
-from sqlalchemy import Column, String, create_engine
+import os
+import logging
+from threading import Lock
+import time
+from sqlalchemy import Column, String, Integer, create_engine, exc
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+logger = logging.getLogger(__name__)
+
 database_path = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
@@ -9,14 +16,103 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    engine_options are passed to create_engine, by default those of
+    get_engine_options
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, engine_options=None):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if engine_options is None:
+        engine_options = get_engine_options(database_path)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
     db.app = app
     db.init_app(app)
     db.create_all()
 
+'''
+get_engine_options(database_path)
+    returns the create_engine options for the Postgres database at
+    database_path, set by these config vars of the Heroku app, or
+    none for SQLite
+
+    DB_POOL_SIZE            5     connections each dyno keeps open
+    DB_MAX_OVERFLOW         10    extra connections opened under load
+    DB_POOL_TIMEOUT         30    seconds to wait for a connection
+    DB_POOL_RECYCLE         1800  seconds before a connection is replaced
+    DB_POOL_PRE_PING        true  test each connection before it is used
+    DB_STATEMENT_TIMEOUT    0     statement timeout in ms, 0 for none
+    DB_POOL_SLOW_CHECKOUT   0.1   seconds a checkout may wait before it is logged
+
+    keep DB_POOL_SIZE plus DB_MAX_OVERFLOW, times the gunicorn workers
+    of every dyno, under the connection limit of the database plan
+'''
+def get_engine_options(database_path=database_path):
+    if database_path.startswith('sqlite'):
+        return {}
+    environ = os.environ
+    options = {
+        'poolclass': LoggedQueuePool,
+        'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes', 'on'),
+        'slow_checkout': float(environ.get('DB_POOL_SLOW_CHECKOUT', 0.1))
+    }
+    statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={:d}'.format(statement_timeout)
+        }
+    return options
+
+'''
+LoggedQueuePool
+    A QueuePool that times how long each checkout waits for a
+    connection. A checkout slower than slow_checkout seconds, or one
+    that times out, is logged with the pool status and the waits so
+    far, which heroku logs shows, to size DB_POOL_SIZE by
+'''
+class LoggedQueuePool(QueuePool):
+    def __init__(self, creator, slow_checkout=0.1, **kwargs):
+        super().__init__(creator, **kwargs)
+        self.slow_checkout = slow_checkout
+        self.lock = Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.log_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        seconds = time.perf_counter() - start
+        self.log_wait(seconds)
+        return connection
+
+    def log_wait(self, seconds, timed_out=False):
+        slow = timed_out or seconds > self.slow_checkout
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.timeouts += timed_out
+            self.slow_checkouts += slow and not timed_out
+            totals = (self.checkouts, self.slow_checkouts, self.timeouts,
+                self.wait_seconds * 1000 / self.checkouts)
+        if slow:
+            logger.warning('%s %.1f ms for a database connection (%s; '
+                'checkouts=%d slow=%d timeouts=%d mean_wait_ms=%.3f)',
+                'Timed out after' if timed_out else 'Waited', seconds * 1000,
+                self.status(), *totals)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.slow_checkout = self.slow_checkout
+        return pool
 
 '''
 Person